@@ -0,0 +1,1051 @@
+# benchmarks.py
+# -------------
+# Timing harness for the contest engine.  Each benchmark runs over every
+# bundled layout in layouts/ plus a few generated RANDOM<seed> mazes.
+
+"""
+Benchmarks for the performance-sensitive parts of the contest code.
+
+USAGE:      python benchmarks.py <benchmark> [options]
+EXAMPLES:   python benchmarks.py distances
+            python benchmarks.py distances --check --seeds 1,2,3
+"""
+
+import os, sys, time
+
+import layout
+import mazeGenerator
+
+BENCHMARKS = {}
+
+def benchmark(function):
+  "Registers a benchmark under its function name"
+  BENCHMARKS[function.__name__] = function
+  return function
+
+def loadLayouts(seeds):
+  """
+  Returns (name, Layout) pairs for every bundled layout followed by the
+  RANDOM<seed> mazes for the given seeds.
+  """
+  layouts = []
+  for fileName in sorted(os.listdir('layouts')):
+    if fileName.endswith('.lay'):
+      layouts.append((fileName[:-4], layout.getLayout(fileName)))
+  for seed in seeds:
+    layouts.append(('RANDOM%d' % seed, layout.Layout(mazeGenerator.generateMaze(seed).split('\n'))))
+  return layouts
+
+def timed(function, *args):
+  start = time.perf_counter()
+  result = function(*args)
+  return result, time.perf_counter() - start
+
+##############
+# Benchmarks #
+##############
+
+def referenceDistances(layout):
+  "The original UCS all-pairs computation, kept to validate new engines"
+  import util
+  distances = {}
+  allNodes = layout.walls.asList(False)
+  for source in allNodes:
+    dist = dict((node, sys.maxsize) for node in allNodes)
+    closed = {}
+    queue = util.PriorityQueue()
+    queue.push(source, 0)
+    dist[source] = 0
+    while not queue.isEmpty():
+      node = queue.pop()
+      if node in closed: continue
+      closed[node] = True
+      x, y = node
+      for other in [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]:
+        if other in dist and dist[node] + 1 < dist[other]:
+          dist[other] = dist[node] + 1
+          queue.push(other, dist[other])
+    for target in allNodes:
+      distances[(target, source)] = dist[target]
+  return distances
+
+@benchmark
+def distances(layouts, options):
+  "All-pairs maze distances (distanceCalculator.computeDistances)"
+  import distanceCalculator
+  print('%-20s %6s %10s %10s' % ('layout', 'cells', 'bfs (s)', 'ucs (s)'))
+  for name, l in layouts:
+    table, elapsed = timed(distanceCalculator.computeDistances, l)
+    reference = ''
+    if options.check:
+      expected, refElapsed = timed(referenceDistances, l)
+      for (pos1, pos2), d in expected.items():
+        if distanceCalculator.getDistanceOnGrid(table, pos1, pos2) != d:
+          raise Exception('Distance mismatch on %s between %s and %s' % (name, pos1, pos2))
+      reference = '%10.3f' % refElapsed
+    print('%-20s %6d %10.3f %s' % (name, table.numCells, elapsed, reference))
+
+def allocatedBytes(function, *args):
+  "Returns the result of a call along with the bytes it left allocated"
+  import tracemalloc
+  tracemalloc.start()
+  try:
+    before = tracemalloc.get_traced_memory()[0]
+    result = function(*args)
+    return result, tracemalloc.get_traced_memory()[0] - before
+  finally:
+    tracemalloc.stop()
+
+@benchmark
+def memory(layouts, options):
+  "Memory held by one agent's distances: tuple-keyed dict vs DistanceTable"
+  import distanceCalculator
+  print('%-20s %6s %12s %12s %8s' % ('layout', 'cells', 'dict (KB)', 'table (KB)', 'ratio'))
+  for name, l in layouts:
+    expected, before = allocatedBytes(referenceDistances, l)
+    del expected
+    table, after = allocatedBytes(distanceCalculator.computeDistances, l)
+    print('%-20s %6d %12.1f %12.1f %7.1fx' % (name, table.numCells, before / 1024.0, after / 1024.0, before / float(after)))
+
+@benchmark
+def lazyDistances(layouts, options):
+  "Lazy LRU distance rows vs full precomputation for queries from few sources"
+  import distanceCalculator, random
+  print('%-20s %6s %10s %10s %8s %8s %8s' % ('layout', 'cells', 'full (s)', 'lazy (s)', 'hits', 'misses', 'evicted'))
+  for name, l in layouts:
+    cells = l.walls.asList(False)
+    rand = random.Random(0)
+    sources = rand.sample(cells, min(len(cells), options.sources))
+    queries = [(rand.choice(sources), rand.choice(cells)) for i in range(20000)]
+    def run(distancer):
+      distancer.getMazeDistances()
+      for pos1, pos2 in queries:
+        distancer.getDistance(pos1, pos2)
+      return distancer
+    distanceCalculator.distanceMap.clear()
+    full, fullElapsed = timed(run, distanceCalculator.Distancer(l))
+    distanceCalculator.distanceMap.clear()
+    maxBytes = options.cacheRows * 2 * len(cells)
+    lazy, lazyElapsed = timed(run, distanceCalculator.Distancer(l, lazy=True, maxCacheBytes=maxBytes))
+    stats = lazy.getCacheStats()
+    print('%-20s %6d %10.3f %10.3f %8d %8d %8d' % (name, len(cells), fullElapsed, lazyElapsed,
+                                                 stats['hits'], stats['misses'], stats['evictions']))
+
+@benchmark
+def incrementalDistances(layouts, options):
+  """
+  Four agents spreading the maze distances over 2 ms turns, as CaptureAgent
+  does on large mazes: turns until the table is done and the cost of a
+  getDistances query while it is not.  --check verifies that the agents
+  share one table, that queries compute no rows and that they read exact
+  distances where a row is done and Manhattan distance elsewhere.
+  """
+  import distanceCalculator, random
+  print('%-20s %6s %8s %16s' % ('layout', 'cells', 'turns', 'query us/target'))
+  for name, l in layouts:
+    distanceCalculator.distanceMap.clear()
+    distanceCalculator.incrementalMap.clear()
+    exact = distanceCalculator.computeDistances(l)
+    cells = l.walls.asList(False)
+    rand = random.Random(0)
+    distancers = [distanceCalculator.Distancer(l) for i in range(4)]
+    turns, queryTime, queries = 0, 0.0, 0
+    while not all([distancer.computeMazeDistances(0.002) for distancer in distancers]):
+      turns += 1
+      tables = set(id(distancer._distances) for distancer in distancers if not distancer.isReadyForMazeDistance())
+      table = distancers[0]._distances
+      done = table.numComputed
+      source, targets = rand.choice(cells), rand.sample(cells, min(len(cells), 50))
+      result, elapsed = timed(distancers[turns % 4].getDistances, source, targets)
+      queryTime += elapsed
+      queries += len(targets)
+      if options.check:
+        if len(tables) != 1:
+          raise Exception('%s: the agents hold %d different tables' % (name, len(tables)))
+        if isinstance(table, distanceCalculator.IncrementalDistanceTable):
+          if table.numComputed != done:
+            raise Exception('%s: a query computed rows outside the budget' % name)
+          i, index = table.cellIndex[source], table.cellIndex
+          expected = [exact.getDistance(source, target) if table.computed[i] or table.computed[index[target]]
+                      else distanceCalculator.manhattanDistance(source, target) for target in targets]
+          if result != expected:
+            raise Exception('%s: distances from %s differ after %d turns' % (name, source, turns))
+    print('%-20s %6d %8d %16.2f' % (name, len(cells), turns, 1e6 * queryTime / max(1, queries)))
+
+@benchmark
+def distanceFiles(layouts, options):
+  """
+  Reading a cached distance file the first time in a process (checksum
+  computed) vs again (already verified).  --check reads back the written
+  distances, makes sure a corrupt or truncated file is rejected, and on
+  Linux that rejected files are not left mapped.
+  """
+  import distanceCalculator, tempfile, shutil
+  print('%-20s %6s %12s %12s %8s' % ('layout', 'cells', 'first (us)', 'again (us)', 'speedup'))
+  directory = tempfile.mkdtemp()
+  try:
+    for name, l in layouts:
+      table = distanceCalculator.computeDistances(l)
+      fileName = distanceCalculator.cacheFileName(l.walls, directory)
+      distanceCalculator.writeDistanceFile(fileName, l.walls, table.matrix)
+      def firstRead():
+        distanceCalculator._verifiedFiles.clear()
+        return distanceCalculator.readDistanceFile(fileName, l.walls)
+      firstElapsed = min(timed(firstRead)[1] for repeat in range(5))
+      againElapsed = min(timed(distanceCalculator.readDistanceFile, fileName, l.walls)[1] for repeat in range(5))
+      print('%-20s %6d %12.1f %12.1f %7.1fx' % (name, table.numCells, 1e6 * firstElapsed, 1e6 * againElapsed,
+                                                firstElapsed / againElapsed))
+      if options.check:
+        cells = l.walls.asList(False)
+        read = distanceCalculator.readDistanceFile(fileName, l.walls)
+        if any(read.getDistance(cells[0], cell) != table.getDistance(cells[0], cell) for cell in cells):
+          raise Exception('%s: distances read back differ' % name)
+        del read
+        with open(fileName, 'rb') as f:
+          data = bytearray(f.read())
+        data[-1] ^= 1
+        for contents in [bytes(data), bytes(data[:10])]:
+          with open(fileName + '.tmp', 'wb') as f:
+            f.write(contents)
+          os.replace(fileName + '.tmp', fileName)
+          if distanceCalculator.readDistanceFile(fileName, l.walls) is not None:
+            raise Exception('%s: a damaged distance file was accepted' % name)
+        if os.path.exists('/proc/self/maps'):
+          with open('/proc/self/maps') as f:
+            if fileName in f.read():
+              raise Exception('%s: a rejected distance file is still mapped' % name)
+  finally:
+    shutil.rmtree(directory)
+
+def initialState(l):
+  import capture
+  state = capture.GameState()
+  state.initialize(l, 4)
+  state.data.timeleft = 1200
+  return state
+
+def randomPlayout(state, numMoves, rand, startIndex=0, successor=None):
+  """
+  Plays uniformly random legal moves, returning the visited states.
+  successor(state, agentIndex, action) replaces generateSuccessor if given.
+  """
+  states = [state]
+  agentIndex = startIndex
+  for i in range(numMoves):
+    action = rand.choice(state.getLegalActions(agentIndex))
+    if successor is None:
+      state = state.generateSuccessor(agentIndex, action)
+    else:
+      state = successor(state, agentIndex, action)
+    states.append(state)
+    agentIndex = (agentIndex + 1) % state.getNumAgents()
+  return states
+
+def successorRate(state, numMoves, seed=0):
+  "Successors generated per second by a random playout"
+  import random
+  states, elapsed = timed(randomPlayout, state, numMoves, random.Random(seed))
+  return numMoves / elapsed
+
+@benchmark
+def grids(layouts, options):
+  "List-backed Grid vs BitGrid food: successor throughput and hashing"
+  import game
+  print('%-20s %14s %14s %12s %12s' % ('layout', 'Grid succ/s', 'BitGrid succ/s', 'Grid hash/s', 'Bit hash/s'))
+  for name, l in layouts:
+    rates = []
+    for backend in [game.Grid, game.BitGrid]:
+      state = initialState(l)
+      if backend is game.Grid:
+        state.data.food = state.data.food.toGrid()
+      rates.append(successorRate(state, options.moves))
+    hashRates = []
+    for food in [l.food, game.BitGrid.fromGrid(l.food)]:
+      repeats = 2000
+      result, elapsed = timed(lambda: [hash(food) for i in range(repeats)])
+      hashRates.append(repeats / elapsed)
+    print('%-20s %14.0f %14.0f %12.0f %12.0f' % (name, rates[0], rates[1], hashRates[0], hashRates[1]))
+
+def referencePackBits(grid):
+  "The original cell-by-cell Grid.packBits (with integer division fixed)"
+  bits = [grid.width, grid.height]
+  currentInt = 0
+  for i in range(grid.height * grid.width):
+    bit = 30 - (i % 30) - 1
+    x, y = i // grid.height, i % grid.height
+    if grid[x][y]:
+      currentInt += 2 ** bit
+    if (i + 1) % 30 == 0:
+      bits.append(currentInt)
+      currentInt = 0
+  bits.append(currentInt)
+  return tuple(bits)
+
+def randomFoodGrids(l, count, seed=0):
+  "Food grids with random subsets of a layout's food eaten"
+  import game, random
+  rand = random.Random(seed)
+  food = l.food.asList()
+  grids = []
+  for i in range(count):
+    grid = game.BitGrid(l.width, l.height)
+    for x, y in rand.sample(food, rand.randint(0, len(food))):
+      grid[x][y] = True
+    grids.append(grid)
+  return grids
+
+@benchmark
+def gridCodec(layouts, options):
+  "Round-trip checks and packing throughput for 10k food grids per layout"
+  import game, pickle
+  print('%-20s %12s %12s %12s %12s %8s' % ('layout', 'old pack/s', 'packBits/s', 'toBytes/s', 'fromBytes/s', 'bytes'))
+  for name, l in layouts:
+    grids = randomFoodGrids(l, options.grids)
+    listGrids = [g.toGrid() for g in grids]
+    for bitGrid, listGrid in zip(grids[:200], listGrids):
+      packed = referencePackBits(listGrid)
+      if listGrid.packBits() != packed or bitGrid.packBits() != packed:
+        raise Exception('packBits differs from the reference on %s' % name)
+      if game.reconstituteGrid(packed) != listGrid:
+        raise Exception('reconstituteGrid does not round-trip on %s' % name)
+      data = game.gridToBytes(listGrid)
+      if game.gridFromBytes(data)[0] != bitGrid or game.gridFromBytes(data, 0, False)[0].data != listGrid.data:
+        raise Exception('gridFromBytes does not round-trip on %s' % name)
+      if pickle.loads(pickle.dumps(bitGrid)) != bitGrid or pickle.loads(pickle.dumps(listGrid)).data != listGrid.data:
+        raise Exception('pickling does not round-trip on %s' % name)
+    sample = listGrids[:max(1, len(listGrids) // 20)]
+    oldResult, oldElapsed = timed(lambda: [referencePackBits(g) for g in sample])
+    packed, packElapsed = timed(lambda: [g.packBits() for g in grids])
+    encoded, encodeElapsed = timed(lambda: [game.gridToBytes(g) for g in grids])
+    decoded, decodeElapsed = timed(lambda: [game.gridFromBytes(data) for data in encoded])
+    print('%-20s %12.0f %12.0f %12.0f %12.0f %8d' % (name, len(sample) / oldElapsed, len(grids) / packElapsed,
+                                                   len(grids) / encodeElapsed, len(grids) / decodeElapsed, len(encoded[0])))
+
+def fullCopySuccessor(state, agentIndex, action):
+  "generateSuccessor as it was before copy-on-write: every agent state is cloned"
+  import capture
+  successor = capture.GameState(state)
+  capture.AgentRules.applyAction(successor, action, agentIndex)
+  capture.AgentRules.checkDeath(successor, agentIndex)
+  capture.AgentRules.decrementTimer(successor.data.agentStates[agentIndex])
+  successor.data._agentMoved = agentIndex
+  successor.data.score += successor.data.scoreChange
+  successor.data.timeleft = state.data.timeleft - 1
+  successor.data.updateZobristKey(state.data.agentStates, state.data.score)
+  return successor
+
+def stateSummary(state):
+  "Everything the rules can change, as plain values"
+  data = state.data
+  agents = tuple((a.configuration.pos, a.configuration.direction, a.isPacman, a.scaredTimer,
+                  a.numCarrying, a.numReturned) for a in data.agentStates)
+  return (agents, data.food.toBits(), tuple(data.capsules), data.score, data.scoreChange,
+          data.timeleft, data._win, data._lose, data._agentMoved, data._foodEaten,
+          data._foodAdded and tuple(data._foodAdded), data._capsuleEaten, data.getZobristKey(),
+          data.carriedFood, data.returnedFood)
+
+def teamFoodTotals(state):
+  "The (red, blue) carried and returned food, summed over the agents"
+  totals = [[0, 0], [0, 0]]
+  for index, agentState in enumerate(state.data.agentStates):
+    team = 0 if state.isOnRedTeam(index) else 1
+    totals[0][team] += agentState.numCarrying
+    totals[1][team] += agentState.numReturned
+  return tuple(totals[0]), tuple(totals[1])
+
+@benchmark
+def successors(layouts, options):
+  """
+  Copy-on-write generateSuccessor vs the full-copy version, expanding every
+  legal action of the states along a random playout.  --check compares the
+  two expansions, verifies that no parent state was modified, and changes
+  agent states through getAgentState to check that a change made on a
+  child never reaches its parent, nor one made on a parent its child.
+  """
+  import capture, random
+  print('%-20s %10s %14s %14s %8s' % ('layout', 'expanded', 'full succ/s', 'COW succ/s', 'speedup'))
+  for name, l in layouts:
+    states = randomPlayout(initialState(l), options.moves, random.Random(0))
+    moves = [(state, index, action) for i, state in enumerate(states)
+             for index in [i % state.getNumAgents()] for action in state.getLegalActions(index)]
+    summaries = [stateSummary(state) for state in states]
+    rates = []
+    for successor in [fullCopySuccessor, capture.GameState.generateSuccessor]:
+      best = min(timed(lambda: [successor(*move) for move in moves])[1] for repeat in range(3))
+      rates.append(len(moves) / best)
+    print('%-20s %10d %14.0f %14.0f %7.2fx' % (name, len(moves), rates[0], rates[1], rates[1] / rates[0]))
+    if options.check:
+      for move in moves:
+        if stateSummary(fullCopySuccessor(*move)) != stateSummary(move[0].generateSuccessor(*move[1:])):
+          raise Exception('%s: successors differ for agent %d playing %s' % ((name,) + move[1:]))
+      if [stateSummary(state) for state in states] != summaries:
+        raise Exception('%s: a successor modified its parent state' % name)
+      for state, index, action in moves:
+        parent = state.deepCopy()
+        parentSummary = stateSummary(parent)
+        child = parent.generateSuccessor(index, action)
+        for agentIndex in range(child.getNumAgents()):
+          child.getAgentState(agentIndex).scaredTimer += 40
+        if stateSummary(parent) != parentSummary:
+          raise Exception('%s: changing a successor for agent %d playing %s changed its parent' %
+                          (name, index, action))
+        childSummary = stateSummary(child)
+        for agentIndex in range(parent.getNumAgents()):
+          parent.getAgentState(agentIndex).numCarrying += 1
+        if stateSummary(child) != childSummary:
+          raise Exception('%s: changing a parent changed its successor for agent %d playing %s' %
+                          (name, index, action))
+
+@benchmark
+def applyUndo(layouts, options):
+  """
+  In-place apply/undo vs generateSuccessor over every legal action along a
+  random playout.  --check also replays random games through both paths,
+  comparing the states after each apply and each undo.
+  """
+  import random
+  print('%-20s %10s %14s %14s %8s' % ('layout', 'expanded', 'succ/s', 'apply+undo/s', 'speedup'))
+  for name, l in layouts:
+    states = randomPlayout(initialState(l), options.moves, random.Random(0))
+    moves = [(state, index, action) for i, state in enumerate(states)
+             for index in [i % state.getNumAgents()] for action in state.getLegalActions(index)]
+    def applyAndUndo():
+      for state, index, action in moves:
+        state.undo(state.apply(index, action))
+    successorTime = min(timed(lambda: [state.generateSuccessor(index, action) for state, index, action in moves])[1]
+                        for repeat in range(3))
+    applyTime = min(timed(applyAndUndo)[1] for repeat in range(3))
+    print('%-20s %10d %14.0f %14.0f %7.2fx' % (name, len(moves), len(moves) / successorTime,
+                                              len(moves) / applyTime, successorTime / applyTime))
+    if options.check:
+      checkApplyUndo(name, l, options.moves, random.Random(1))
+
+def checkApplyUndo(name, l, numMoves, rand, depth=4):
+  """
+  Walks one random game with apply, and from each of its states a random
+  depth-limited line, comparing against generateSuccessor at every step and
+  against the saved states after unwinding the undo tokens.  The successors
+  generated along the way must survive the undos unchanged.
+  """
+  state = initialState(l)
+  history = [stateSummary(state)]
+  tokens = []
+  agentIndex = 0
+  for move in range(numMoves):
+    line = []
+    lineIndex = agentIndex
+    for ply in range(depth):
+      action = rand.choice(state.getLegalActions(lineIndex))
+      expected = state.generateSuccessor(lineIndex, action)
+      before = stateSummary(state)
+      line.append((state.apply(lineIndex, action), before, expected, stateSummary(expected)))
+      if stateSummary(state) != line[-1][3]:
+        raise Exception('%s: apply differs from generateSuccessor after %d moves' % (name, move))
+      if state.isOver(): break
+      lineIndex = (lineIndex + 1) % state.getNumAgents()
+    while line:
+      token, before, expected, expectedSummary = line.pop()
+      state.undo(token)
+      if stateSummary(state) != before:
+        raise Exception('%s: undo did not restore the state after %d moves' % (name, move))
+      if stateSummary(expected) != expectedSummary:
+        raise Exception('%s: a successor changed when its parent was undone after %d moves' % (name, move))
+    if state.isOver(): break
+    tokens.append(state.apply(agentIndex, rand.choice(state.getLegalActions(agentIndex))))
+    history.append(stateSummary(state))
+    agentIndex = (agentIndex + 1) % state.getNumAgents()
+  while tokens:
+    history.pop()
+    state.undo(tokens.pop())
+    if stateSummary(state) != history[-1]:
+      raise Exception('%s: unwinding the game did not restore move %d' % (name, len(tokens)))
+
+@benchmark
+def transpositions(layouts, options):
+  """
+  A transposition table over every successor along a random playout: bytes
+  retained per stored state and GameState hashes per second.
+  """
+  import random
+  print('%-20s %8s %16s %12s' % ('layout', 'states', 'bytes per state', 'hash/s'))
+  for name, l in layouts:
+    def fillTable():
+      table = {}
+      for state in randomPlayout(initialState(l), options.moves, random.Random(0)):
+        table[state] = state
+      return table
+    table, retained = allocatedBytes(fillTable)
+    states = list(table)
+    elapsed = min(timed(lambda: [state.data.__hash__() for state in states])[1] for repeat in range(3))
+    print('%-20s %8d %16.0f %12.0f' % (name, len(states), retained / float(len(states)), len(states) / elapsed))
+
+def referenceLegalActions(state, agentIndex):
+  "AgentRules.getLegalActions before the per-layout table"
+  import game
+  return game.Actions.getPossibleActions(state.getAgentState(agentIndex).configuration, state.data.layout.walls)
+
+@benchmark
+def legalActions(layouts, options):
+  """
+  getLegalActions from the per-layout table vs Actions.getPossibleActions
+  over the states of a random playout, and the playout's successor rate.
+  --check compares the two on every state and agent.
+  """
+  import random
+  print('%-20s %14s %14s %8s %12s' % ('layout', 'old legal/s', 'table legal/s', 'speedup', 'playout/s'))
+  for name, l in layouts:
+    states = randomPlayout(initialState(l), options.moves, random.Random(0))
+    queries = [(state, index) for state in states for index in range(state.getNumAgents())]
+    if options.check:
+      for state, index in queries:
+        if state.getLegalActions(index) != referenceLegalActions(state, index):
+          raise Exception('%s: legal actions differ for agent %d at %s' % (name, index, state.getAgentPosition(index)))
+    oldElapsed = min(timed(lambda: [referenceLegalActions(*query) for query in queries])[1] for repeat in range(3))
+    newElapsed = min(timed(lambda: [state.getLegalActions(index) for state, index in queries])[1] for repeat in range(3))
+    print('%-20s %14.0f %14.0f %7.2fx %12.0f' % (name, len(queries) / oldElapsed, len(queries) / newElapsed,
+                                                oldElapsed / newElapsed, successorRate(initialState(l), options.moves)))
+
+def referenceDumpFoodFromDeath(state, agentState, agentIndex):
+  "AgentRules.dumpFoodFromDeath before the deque rewrite, kept as a regression reference"
+  from capture import Configuration, DUMP_FOOD_ON_DEATH
+  if not (DUMP_FOOD_ON_DEATH):
+    # this feature is not turned on
+    return
+
+  if not agentState.isPacman:
+    raise Exception('something is seriously wrong, this agent isnt a pacman!')
+
+  # ok so agentState is this:
+  if (agentState.numCarrying == 0):
+    return
+  
+  # first, score changes!
+  # we HACK pack that ugly bug by just determining if its red based on the first position
+  # to die...
+  dummyConfig = Configuration(agentState.getPosition(), 'North')
+  isRed = state.isRed(dummyConfig)
+
+  # the score increases if red eats dots, so if we are refunding points,
+  # the direction should be -1 if the red agent died, which means he dies
+  # on the blue side
+  scoreDirection = (-1)**(int(isRed) + 1)
+  #state.data.scoreChange += scoreDirection * agentState.numCarrying
+
+  def onRightSide(state, x, y):
+    dummyConfig = Configuration((x, y), 'North')
+    return state.isRed(dummyConfig) == isRed
+
+  # we have food to dump
+  # -- expand out in BFS. Check:
+  #   - that it's within the limits
+  #   - that it's not a wall
+  #   - that no other agents are there
+  #   - that no power pellets are there
+  #   - that it's on the right side of the grid
+  def allGood(state, x, y):
+    width, height = state.data.layout.width, state.data.layout.height
+    food, walls = state.data.food, state.data.layout.walls
+
+    # bounds check
+    if x >= width or y >= height or x <= 0 or y <= 0:
+      return False
+
+    if walls[x][y]:
+      return False
+    if food[x][y]:
+      return False
+
+    # dots need to be on the side where this agent will be a pacman :P
+    if not onRightSide(state, x, y):
+      return False
+
+    if (x,y) in state.data.capsules:
+      return False
+
+    # loop through agents
+    agentPoses = [state.getAgentPosition(i) for i in range(state.getNumAgents())]
+    if (x,y) in agentPoses:
+      return False
+
+    return True
+
+  numToDump = agentState.numCarrying
+  state.data.getMutableFood()
+  foodAdded = []
+
+  def genSuccessors(x, y):
+    DX = [-1, 0, 1]
+    DY = [-1, 0, 1]
+    return [(x + dx, y + dy) for dx in DX for dy in DY]
+
+  # BFS graph search
+  positionQueue = [agentState.getPosition()]
+  seen = set()
+  while numToDump > 0:
+    if not len(positionQueue):
+      raise Exception('Exhausted BFS! uh oh')
+    # pop one off, graph check
+    popped = positionQueue.pop(0)
+    if popped in seen:
+      continue
+    seen.add(popped)
+
+    x, y = popped[0], popped[1]
+    x = int(x)
+    y = int(y)
+    if (allGood(state, x, y)):
+      state.data.food[x][y] = True
+      foodAdded.append((x, y))
+      numToDump -= 1
+
+    # generate successors
+    positionQueue = positionQueue + genSuccessors(x, y)
+
+  state.data._foodAdded = foodAdded
+  # now our agentState is no longer carrying food
+  agentState.numCarrying = 0
+
+def randomDeaths(l, count, rand):
+  """
+  Returns count (state, agentIndex) pairs, each a copy of a random playout
+  state with one agent moved to a random cell as a pacman carrying food.
+  """
+  import capture, game
+  states = randomPlayout(initialState(l), 400, rand)
+  cells = l.walls.asList(False)
+  deaths = []
+  while len(deaths) < count:
+    state = rand.choice(states).deepCopy()
+    agentIndex = rand.randrange(state.getNumAgents())
+    agentState = state.data.agentStates[agentIndex]
+    agentState.configuration = game.Configuration(rand.choice(cells), game.Directions.NORTH)
+    agentState.isPacman = True
+    # Never ask for more dots than the side has room for, or the BFS would not end
+    occupied = set(state.data.capsules) | set(state.getAgentPosition(i) for i in range(state.getNumAgents()))
+    free = [cell for cell in capture.dumpCells(l, state.isRed(agentState.configuration))
+            if cell not in occupied and not state.data.food[cell[0]][cell[1]]]
+    if not free: continue
+    agentState.numCarrying = rand.randint(1, min(len(free), 60))
+    deaths.append((state, agentIndex))
+  return deaths
+
+@benchmark
+def dumpFood(layouts, options):
+  """
+  AgentRules.dumpFoodFromDeath vs the original list-based BFS on randomized
+  deaths.  --check compares the placed dots and their order.
+  """
+  import capture, random
+  print('%-20s %8s %12s %12s %8s' % ('layout', 'deaths', 'old dumps/s', 'new dumps/s', 'speedup'))
+  for name, l in layouts:
+    deaths = randomDeaths(l, 200, random.Random(0))
+    copies = [[(state.deepCopy(), index) for state, index in deaths] for repeat in range(2)]
+    def dumpAll(dump, copies):
+      for state, index in copies:
+        dump(state, state.data.agentStates[index], index)
+    oldElapsed = timed(dumpAll, referenceDumpFoodFromDeath, copies[0])[1]
+    newElapsed = timed(dumpAll, capture.AgentRules.dumpFoodFromDeath, copies[1])[1]
+    print('%-20s %8d %12.0f %12.0f %7.1fx' % (name, len(deaths), len(deaths) / oldElapsed,
+                                             len(deaths) / newElapsed, oldElapsed / newElapsed))
+    if options.check:
+      for (old, index), (new, index) in zip(*copies):
+        if old.data._foodAdded != new.data._foodAdded or old.data.food != new.data.food:
+          raise Exception('%s: dumped food differs for agent %d at %s' % (name, index, old.getAgentPosition(index)))
+
+@benchmark
+def deepCopies(layouts, options):
+  """
+  GameState.deepCopy sharing the interned layout vs re-parsing the layout
+  text into a private copy, as deepCopy used to.  --check verifies that
+  walls are frozen and that clone() gives a writable private layout.
+  """
+  print('%-20s %14s %14s %8s' % ('layout', 'reparse/s', 'shared/s', 'speedup'))
+  for name, l in layouts:
+    state = initialState(l)
+    def reparsingCopy():
+      copy = state.deepCopy()
+      copy.data.layout = layout.Layout(l.layoutText[:])
+      return copy
+    repeats = 200
+    oldElapsed = min(timed(lambda: [reparsingCopy() for i in range(repeats)])[1] for repeat in range(3))
+    newElapsed = min(timed(lambda: [state.deepCopy() for i in range(repeats)])[1] for repeat in range(3))
+    print('%-20s %14.0f %14.0f %7.1fx' % (name, repeats / oldElapsed, repeats / newElapsed, oldElapsed / newElapsed))
+    if options.check:
+      if state.deepCopy().data.layout is not l:
+        raise Exception('%s: deepCopy did not share the layout' % name)
+      x, y = l.walls.asList(False)[0]
+      try:
+        l.walls[x][y] = True
+      except TypeError:
+        pass
+      else:
+        raise Exception('%s: layout walls are writable' % name)
+      clone = l.clone()
+      clone.getLegalActionTable()
+      clone.walls[x][y] = True
+      if l.walls[x][y] or clone.walls == l.walls:
+        raise Exception('%s: clone shares its walls with the layout' % name)
+      if clone.getWallFingerprint() == l.getWallFingerprint() or (x, y) in clone.getLegalActionTable():
+        raise Exception('%s: clone kept the tables of its walls before the edit' % name)
+      clone.refreeze()
+      if clone.getLegalActionTable() is not clone.getLegalActionTable() or (x, y) in clone.getLegalActionTable():
+        raise Exception('%s: refrozen clone does not cache its own tables' % name)
+
+def referenceObservation(state, index):
+  "Game.run's observation before the lightweight view: two deep copies"
+  import util, capture
+  state = state.deepCopy().deepCopy()
+  pos = state.getAgentPosition(index)
+  n = state.getNumAgents()
+  state.agentDistances = [capture.noisyDistance(pos, state.getAgentPosition(i)) for i in range(n)]
+  if index in state.blueTeam:
+    team, otherTeam = state.blueTeam, state.redTeam
+  else:
+    team, otherTeam = state.redTeam, state.blueTeam
+  for enemy in otherTeam:
+    seen = False
+    enemyPos = state.getAgentPosition(enemy)
+    for teammate in team:
+      if util.manhattanDistance(enemyPos, state.getAgentPosition(teammate)) <= capture.SIGHT_RANGE:
+        seen = True
+    if not seen: state.data.agentStates[enemy].configuration = None
+  state.data.rehash()
+  return state
+
+def gameRunObservation(state, index):
+  "What Game.run gives a CaptureAgent: makeObservation on a copy-on-write view"
+  import capture
+  return capture.GameState(state, copyOnWrite = True).makeObservation(index)
+
+def observationSummary(state):
+  "What an agent can see of an observation, as plain values"
+  data = state.data
+  agents = tuple((a.getPosition(), a.configuration and a.configuration.direction, a.isPacman, a.scaredTimer,
+                  a.numCarrying, a.numReturned) for a in data.agentStates)
+  return (agents, data.food.toBits(), tuple(data.capsules), data.score, data.timeleft, data._agentMoved,
+          data._foodEaten, data._foodAdded and tuple(data._foodAdded), data._capsuleEaten, data.getZobristKey(),
+          tuple(state.agentDistances), tuple(state.redTeam), tuple(state.blueTeam), state.data.layout.layoutText)
+
+@benchmark
+def observations(layouts, options):
+  """
+  Per-turn cost of building an agent's observation over a recorded game,
+  the whole Game.run path: the old two deep copies vs the copy-on-write
+  view handed to observationFunction and the view makeObservation builds
+  on it.  --check compares the two observations with the same sonar noise
+  and verifies that writing to an observation through its accessors
+  leaves the game state alone.
+  """
+  import random
+  print('%-20s %8s %14s %14s %8s' % ('layout', 'turns', 'old us/turn', 'new us/turn', 'speedup'))
+  for name, l in layouts:
+    game, times = playGame(l, 'baselineTeam', 'baselineTeam', options.length)
+    state = initialState(l)
+    turns = []
+    for agentIndex, action in game.moveHistory:
+      turns.append((state, agentIndex))
+      state = state.generateSuccessor(agentIndex, action)
+    oldElapsed = min(timed(lambda: [referenceObservation(*turn) for turn in turns])[1] for repeat in range(3))
+    newElapsed = min(timed(lambda: [gameRunObservation(state, index) for state, index in turns])[1]
+                     for repeat in range(3))
+    print('%-20s %8d %14.1f %14.1f %7.1fx' % (name, len(turns), 1e6 * oldElapsed / len(turns),
+                                             1e6 * newElapsed / len(turns), oldElapsed / newElapsed))
+    if options.check:
+      for state, index in turns:
+        random.seed(index)
+        expected = observationSummary(referenceObservation(state, index))
+        random.seed(index)
+        observation = gameRunObservation(state, index)
+        if observationSummary(observation) != expected:
+          raise Exception('%s: observations differ for agent %d' % (name, index))
+        before = stateSummary(state)
+        food = observation.data.getMutableFood()
+        for x, y in food.asList():
+          food[x][y] = False
+        observation.data.getMutableCapsules().clear()
+        for agentIndex in range(observation.getNumAgents()):
+          observation.getAgentState(agentIndex).scaredTimer += 40
+        if stateSummary(state) != before:
+          raise Exception('%s: writing to agent %d\'s observation changed the game' % (name, index))
+
+def referenceStateHash(data):
+  "GameStateData.__hash__ before Zobrist keys"
+  return int((hash(tuple(data.agentStates)) + 13*hash(data.food) + 113* hash(tuple(data.capsules)) + 7 * hash(data.score)) % 1048575 )
+
+def recordedStates(l, length, depth=2):
+  """
+  Replays a baselineTeam mirror match and returns its states together with
+  every state within depth moves of them.
+  """
+  game, times = playGame(l, 'baselineTeam', 'baselineTeam', length)
+  state = initialState(l)
+  frontier = [state]
+  for agentIndex, action in game.moveHistory:
+    state = state.generateSuccessor(agentIndex, action)
+    frontier.append(state)
+  states = []
+  for ply in range(depth + 1):
+    states.extend(frontier)
+    if ply == depth: break
+    frontier = [state.generateSuccessor(agentIndex, action)
+                for state in frontier if not state.isOver()
+                for agentIndex in [((state.data._agentMoved or 0) + 1) % state.getNumAgents()]
+                for action in state.getLegalActions(agentIndex)]
+  return states
+
+@benchmark
+def stateHashes(layouts, options):
+  """
+  Zobrist state keys vs the old GameStateData hash over recorded games and
+  their depth-2 expansions: distinct states, colliding hash values and the
+  rate of filling a transposition set.  --check recomputes every
+  incrementally maintained key from scratch, and edits copies of states
+  into their successors by hand to check hashing and equality afterwards.
+  """
+  print('%-20s %8s %8s %10s %10s %12s %12s' % ('layout', 'states', 'distinct', 'old colls', 'zob colls',
+                                              'old set/s', 'zob set/s'))
+  for name, l in layouts:
+    states = recordedStates(l, options.length)
+    distinct = {}
+    for state in states:
+      data = state.data
+      value = (tuple((a.configuration, a.scaredTimer) for a in data.agentStates), data.food.toBits(),
+               tuple(data.capsules), data.score)
+      distinct.setdefault(value, data)
+      if options.check and data.getZobristKey() != data.computeZobristKey():
+        raise Exception('%s: incremental key out of date after %s' % (name, data._agentMoved))
+      if options.check and (data.carriedFood, data.returnedFood) != teamFoodTotals(state):
+        raise Exception('%s: team food totals out of date after %s' % (name, data._agentMoved))
+    if options.check:
+      checkDirectEdits(name, states[::10])
+    unique = list(distinct.values())
+    oldCollisions = len(unique) - len(set(referenceStateHash(data) for data in unique))
+    zobristCollisions = len(unique) - len(set(data._zobrist for data in unique))
+    oldElapsed = min(timed(lambda: set(referenceStateHash(state.data) for state in states))[1] for repeat in range(3))
+    newElapsed = min(timed(lambda: set(states))[1] for repeat in range(3))
+    print('%-20s %8d %8d %10d %10d %12.0f %12.0f' % (name, len(states), len(unique), oldCollisions, zobristCollisions,
+                                                  len(states) / oldElapsed, len(states) / newElapsed))
+
+def checkDirectEdits(name, states):
+  """
+  Copies each state, reads its key, then edits the copy into each successor
+  that keeps the score through getAgentState, getMutableFood and
+  getMutableCapsules; the copy must then equal and hash like the successor.
+  """
+  for state in states:
+    if state.isOver(): continue
+    agentIndex = ((state.data._agentMoved or 0) + 1) % state.getNumAgents()
+    for action in state.getLegalActions(agentIndex):
+      successor = state.generateSuccessor(agentIndex, action)
+      if successor.data.score != state.data.score: continue
+      edited = state.deepCopy()
+      hash(edited.data)
+      for index, agentState in enumerate(successor.data.agentStates):
+        target = edited.getAgentState(index)
+        target.configuration, target.isPacman, target.scaredTimer = (agentState.configuration, agentState.isPacman,
+                                                                     agentState.scaredTimer)
+      food = edited.data.getMutableFood()
+      for x, y in state.data.food.asList() + successor.data.food.asList():
+        food[x][y] = successor.data.food[x][y]
+      edited.data.getMutableCapsules()[:] = successor.data.capsules
+      if edited.data != successor.data or hash(edited.data) != hash(successor.data):
+        raise Exception('%s: state edited by hand into the successor for %s differs' % (name, action))
+      edited = state.deepCopy()
+      hash(edited.data)
+      edited.getAgentState(agentIndex).configuration = successor.data.agentStates[agentIndex].configuration
+      if edited.data.getZobristKey() != edited.data.computeZobristKey():
+        raise Exception('%s: key out of date after moving agent %d by hand' % (name, agentIndex))
+
+class ReferenceBeliefs:
+  "inference.EnemyBeliefs written the usual way, with a util.Counter per opponent"
+  def __init__(self, gameState, index, sightRange=5):
+    import util
+    self.index, self.sightRange = index, sightRange
+    self.walls = gameState.getWalls()
+    self.cells = self.walls.asList(False)
+    if gameState.isOnRedTeam(index):
+      self.team, self.opponents = gameState.getRedTeamIndices(), gameState.getBlueTeamIndices()
+    else:
+      self.team, self.opponents = gameState.getBlueTeamIndices(), gameState.getRedTeamIndices()
+    self.beliefs = {}
+    for opponent in self.opponents:
+      self.beliefs[opponent] = util.Counter()
+      self.beliefs[opponent][gameState.getInitialAgentPosition(opponent)] = 1.0
+
+  def update(self, gameState):
+    import util
+    from game import Actions
+    position = gameState.getAgentPosition(self.index)
+    distances = gameState.getAgentDistances()
+    teamPositions = [gameState.getAgentPosition(i) for i in self.team]
+    for opponent in self.opponents:
+      opponentPosition = gameState.getAgentPosition(opponent)
+      if opponentPosition is not None:
+        self.beliefs[opponent] = util.Counter()
+        self.beliefs[opponent][opponentPosition] = 1.0
+        continue
+      moved = util.Counter()
+      for cell, p in self.beliefs[opponent].items():
+        neighbors = Actions.getLegalNeighbors(cell, self.walls)
+        for neighbor in neighbors:
+          moved[neighbor] += p / len(neighbors)
+      belief = self.observe(moved, gameState, position, distances[opponent], teamPositions)
+      if belief.totalCount() == 0:
+        uniform = util.Counter()
+        for cell in self.cells:
+          uniform[cell] = 1.0 / len(self.cells)
+        belief = self.observe(uniform, gameState, position, distances[opponent], teamPositions)
+        if belief.totalCount() == 0: belief = uniform
+      self.beliefs[opponent] = belief
+
+  def observe(self, prior, gameState, position, noisyDistance, teamPositions):
+    import util
+    belief = util.Counter()
+    for cell in self.cells:
+      p = prior[cell]
+      if noisyDistance is not None:
+        p *= gameState.getDistanceProb(util.manhattanDistance(position, cell), noisyDistance)
+      for teammatePosition in teamPositions:
+        if teammatePosition is not None and util.manhattanDistance(teammatePosition, cell) <= self.sightRange:
+          p = 0.0
+      belief[cell] = p
+    belief.normalize()
+    return belief
+
+@benchmark
+def beliefs(layouts, options):
+  """
+  Per-turn cost of tracking both opponents' positions from agent 0's
+  observations over a recorded game: util.Counter updates vs
+  inference.EnemyBeliefs.  --check compares every belief after every turn.
+  """
+  import random, inference
+  print('%-20s %8s %8s %14s %14s %8s' % ('layout', 'cells', 'turns', 'old us/turn', 'new us/turn', 'speedup'))
+  for name, l in layouts:
+    game, times = playGame(l, 'baselineTeam', 'baselineTeam', options.length)
+    state = initialState(l)
+    random.seed(0)
+    observations = []
+    for agentIndex, action in game.moveHistory:
+      if agentIndex == 0: observations.append(state.makeObservation(0))
+      state = state.generateSuccessor(agentIndex, action)
+    def track(tracker):
+      for observation in observations:
+        tracker.update(observation)
+    start = observations[0]
+    oldElapsed = min(timed(track, ReferenceBeliefs(start, 0))[1] for repeat in range(3))
+    newElapsed = min(timed(track, inference.EnemyBeliefs(start, 0))[1] for repeat in range(3))
+    print('%-20s %8d %8d %14.1f %14.1f %7.1fx' % (name, len(l.walls.asList(False)), len(observations),
+                                                 1e6 * oldElapsed / len(observations),
+                                                 1e6 * newElapsed / len(observations), oldElapsed / newElapsed))
+    if options.check:
+      reference, tracker = ReferenceBeliefs(start, 0), inference.EnemyBeliefs(start, 0)
+      for turn, observation in enumerate(observations):
+        reference.update(observation)
+        tracker.update(observation)
+        for opponent in tracker.opponents:
+          expected, grid = reference.beliefs[opponent], tracker.getBelief(opponent)
+          if max(abs(expected[cell] - grid[cell]) for cell in reference.cells) > 1e-9:
+            raise Exception('%s: beliefs about agent %d differ on turn %d' % (name, opponent, turn))
+
+def keyframeSummary(state):
+  "The parts of a state a replay keyframe restores, as plain values"
+  data = state.data
+  agents = tuple((a.getPosition(), a.configuration and a.configuration.direction, a.isPacman, a.scaredTimer,
+                  a.numCarrying, a.numReturned) for a in data.agentStates)
+  return (agents, data.food.toBits(), tuple(data.capsules), data.score, data.timeleft, data._agentMoved,
+          data.getZobristKey(), data.carriedFood, data.returnedFood)
+
+@benchmark
+def replays(layouts, options):
+  """
+  Replay file sizes with and without keyframes every --keyframes moves,
+  and the time to seek a ReplayCursor to the last move of a recorded game
+  by replaying from the start vs from the nearest keyframe.  --check seeks
+  to every move, forwards and backwards, and compares with the states of
+  a straight replay.
+  """
+  import replay
+  print('%-20s %6s %10s %10s %14s %14s %8s' % ('layout', 'moves', 'bytes', 'kf bytes', 'old seek us',
+                                                'new seek us', 'speedup'))
+  for name, l in layouts:
+    game, times = playGame(l, 'baselineTeam', 'baselineTeam', options.length)
+    plain = replay.Replay(replay.encodeReplay(l.layoutText, game.moveHistory, options.length, 'Red', 'Blue'))
+    keyed = replay.Replay(replay.encodeReplay(l.layoutText, game.moveHistory, options.length, 'Red', 'Blue',
+                                              keyframeInterval=options.keyframes))
+    last = len(game.moveHistory)
+    oldElapsed = min(timed(lambda: replay.ReplayCursor(plain).seek(last))[1] for repeat in range(3))
+    newElapsed = min(timed(lambda: replay.ReplayCursor(keyed).seek(last))[1] for repeat in range(3))
+    print('%-20s %6d %10d %10d %14.1f %14.1f %7.1fx' % (name, last, len(plain.moves.obj), len(keyed.moves.obj),
+                                                       1e6 * oldElapsed, 1e6 * newElapsed, oldElapsed / newElapsed))
+    if options.check:
+      cursor = replay.ReplayCursor(plain)
+      expected = [keyframeSummary(cursor.state)]
+      while cursor.step():
+        expected.append(keyframeSummary(cursor.state))
+      cursor = replay.ReplayCursor(keyed)
+      for move in list(range(0, last + 1, 7)) + list(range(last, -1, -11)):
+        if keyframeSummary(cursor.seek(move)) != expected[move]:
+          raise Exception('%s: seek to move %d gives a different state' % (name, move))
+      cursor.seek(last)
+      while cursor.back():
+        if keyframeSummary(cursor.state) != expected[cursor.move]:
+          raise Exception('%s: back to move %d gives a different state' % (name, cursor.move))
+
+def playGame(l, redTeam, blueTeam, length, seed=1):
+  """
+  Plays one quiet game and returns (game, seconds spent in each agent's
+  getAction).  Agents are loaded through capture.loadAgents.
+  """
+  import capture, textDisplay, random
+  random.seed(seed)
+  agents = sum([list(el) for el in zip(capture.loadAgents(True, redTeam, True, {}),
+                                       capture.loadAgents(False, blueTeam, True, {}))], [])
+  times = [0.0 for agent in agents]
+  def timedAction(index, getAction):
+    def wrapper(state):
+      start = time.perf_counter()
+      action = getAction(state)
+      times[index] += time.perf_counter() - start
+      return action
+    return wrapper
+  for index, agent in enumerate(agents):
+    agent.getAction = timedAction(index, agent.getAction)
+  rules = capture.CaptureRules(quiet=True)
+  game = rules.newGame(l, agents, textDisplay.NullGraphics(), length, True, False)
+  game.run()
+  return game, times
+
+@benchmark
+def agentMoves(layouts, options):
+  "Per-move getAction time of myTeam (red) against baselineTeam"
+  print('%-20s %6s %8s %14s' % ('layout', 'food', 'moves', 'ms per move'))
+  for name, l in layouts:
+    game, times = playGame(l, 'myTeam', 'baselineTeam', options.length)
+    redMoves = len([1 for index, action in game.moveHistory if index % 2 == 0])
+    print('%-20s %6d %8d %14.3f' % (name, l.totalFood, redMoves, 1000.0 * (times[0] + times[2]) / max(1, redMoves)))
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('--seeds', default='1,2,3',
+                    help='Comma separated RANDOM<seed> mazes to include [Default: %default]')
+  parser.add_option('--length', type='int', default=1200,
+                    help='Game length in moves for game-playing benchmarks [Default: %default]')
+  parser.add_option('--sources', type='int', default=100,
+                    help='Distinct query sources for the lazyDistances benchmark [Default: %default]')
+  parser.add_option('--cacheRows', type='int', default=128,
+                    help='Row cache size for the lazyDistances benchmark [Default: %default]')
+  parser.add_option('--moves', type='int', default=2000,
+                    help='Moves per random playout in successor benchmarks [Default: %default]')
+  parser.add_option('--grids', type='int', default=10000,
+                    help='Food grids per layout in the gridCodec benchmark [Default: %default]')
+  parser.add_option('--keyframes', type='int', default=100,
+                    help='Keyframe interval for the replays benchmark [Default: %default]')
+  parser.add_option('--check', action='store_true', default=False,
+                    help='Validate results against the reference implementation')
+  options, args = parser.parse_args()
+  if len(args) != 1 or args[0] not in BENCHMARKS:
+    parser.error('choose one of: ' + ', '.join(sorted(BENCHMARKS)))
+  seeds = [int(s) for s in options.seeds.split(',') if s]
+  BENCHMARKS[args[0]](loadLayouts(seeds), options)
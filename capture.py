@@ -55,10 +55,12 @@ from game import Actions
 from util import nearestPoint
 from util import manhattanDistance
 from game import Grid
+from game import BitGrid
 from game import Configuration
 from game import Agent
 from game import reconstituteGrid
 import sys, util, types, time, random, imp
+from collections import deque
 import keyboardAgents
 
 # If you change these, you won't affect the server, so you can't cheat
@@ -107,22 +109,93 @@ class GameState:
     """
     Returns the successor state (a GameState object) after the specified agent takes the action.
     """
-    # Copy current state
-    state = GameState(self)
+    # Copy current state, sharing whatever the action leaves untouched
+    state = GameState(self, copyOnWrite = True)
+    state._playAction(agentIndex, action)
+    return state
+
+  def apply( self, agentIndex, action ):
+    """
+    Plays the action on this state in place and returns a token for undo;
+    afterwards the state equals generateSuccessor(agentIndex, action).
+    Meant for tree search: apply/undo pairs must nest like a stack.  Agent
+    states are changed in place (so objects fetched with getAgentState
+    change too), after a one-time clone of any shared with another state;
+    food and capsules are replaced.  The undo records go on one list kept
+    with the state, and the token is just a position in it.
+    """
+    data = self.data
+    journal = data._journal
+    if journal is None:
+      journal = data._journal = []
+    token = len(journal)
+    journal.append((data.food, data.capsules, data.score, data.scoreChange, data.carriedFood, data.returnedFood,
+                    data.timeleft, data._win, data._lose, data._agentMoved, data._foodEaten, data._foodAdded,
+                    data._capsuleEaten, data._zobrist, data._staleAgents))
+    data._sharedFood = True
+    data._sharedCapsules = True
+    data._win = False
+    data._lose = False
+    data.scoreChange = 0
+    data._journalMark = token + 1
+    data._touched = 0
+    try:
+      self._playAction(agentIndex, action)
+    finally:
+      data._journalMark = None
+      data._inMove = False
+    return token
+
+  def undo( self, token ):
+    """
+    Reverts the apply call that returned token.
+    """
+    data = self.data
+    journal = data._journal
+    agentStates, shared = data.agentStates, data._sharedAgents
+    while len(journal) > token + 1:
+      entry = journal.pop()
+      index = entry[0]
+      agentState = agentStates[index]
+      if index in shared:
+        # A successor generated since shares the changed object
+        agentState = agentStates[index] = agentState.copy()
+        shared.discard(index)
+      (agentState.configuration, agentState.isPacman, agentState.scaredTimer, agentState.numCarrying,
+       agentState.numReturned) = entry[1:]
+    (data.food, data.capsules, data.score, data.scoreChange, data.carriedFood, data.returnedFood,
+     data.timeleft, data._win, data._lose, data._agentMoved, data._foodEaten, data._foodAdded,
+     data._capsuleEaten, data._zobrist, data._staleAgents) = journal.pop()
+
+  def _playAction( self, agentIndex, action ):
+    "Runs the rules for one move on a state whose shared parts are marked"
+    self.data._foodEaten = None
+    self.data._foodAdded = None
+    self.data._capsuleEaten = None
+    # apply journals the agents it changes; generateSuccessor compares objects
+    prevAgentStates = None if self.data._journalMark is not None else self.data.agentStates[:]
+    prevScore = self.data.score
+    self.data._inMove = True
 
     # Find appropriate rules for the agent
-    AgentRules.applyAction( state, action, agentIndex )
-    AgentRules.checkDeath(state, agentIndex)
-    AgentRules.decrementTimer(state.data.agentStates[agentIndex])
+    AgentRules.applyAction( self, action, agentIndex )
+    AgentRules.checkDeath(self, agentIndex)
+    AgentRules.decrementTimer(self.data.getMutableAgentState(agentIndex))
 
     # Book keeping
-    state.data._agentMoved = agentIndex
-    state.data.score += state.data.scoreChange
-    state.data.timeleft = self.data.timeleft - 1
-    return state
+    self.data._agentMoved = agentIndex
+    self.data.score += self.data.scoreChange
+    self.data.timeleft -= 1
+    self.data._inMove = False
+    self.data.updateZobristKey(prevAgentStates, prevScore)
 
   def getAgentState(self, index):
-    return self.data.agentStates[index]
+    """
+    Returns agent index's state.  It belongs to this state alone (it is
+    cloned first if a successor or predecessor shares it), so changing it
+    never reaches another state.
+    """
+    return self.data.getMutableAgentState(index)
 
   def getAgentPosition(self, index):
     """
@@ -237,12 +310,14 @@ class GameState:
   # You shouldn't need to call these directly #
   #############################################
 
-  def __init__( self, prevState = None ):
+  def __init__( self, prevState = None, copyOnWrite = False ):
     """
     Generates a new state by copying information from its predecessor.
+    With copyOnWrite the agent states, food and capsules stay shared with
+    prevState until the rules change them (see GameStateData).
     """
     if prevState != None: # Initial state
-      self.data = GameStateData(prevState.data)
+      self.data = GameStateData(prevState.data, copyOnWrite)
       self.blueTeam = prevState.blueTeam
       self.redTeam = prevState.redTeam
       self.data.timeleft = prevState.data.timeleft
@@ -265,7 +340,14 @@ class GameState:
     return state
 
   def makeObservation(self, index):
-    state = self.deepCopy()
+    """
+    Returns the state as agent index sees it: sonar readings added and
+    enemies out of sight hidden.  The observation is a copy-on-write view:
+    it shares agent states, food and capsules with this state, and
+    getAgentState, getMutableFood and getMutableCapsules copy them before
+    anything is written, so only the hidden enemies are ever cloned.
+    """
+    state = GameState(self, copyOnWrite = True)
 
     # Adds the sonar signal
     pos = state.getAgentPosition(index)
@@ -287,7 +369,7 @@ class GameState:
       for teammate in team:
         if util.manhattanDistance(enemyPos, state.getAgentPosition(teammate)) <= SIGHT_RANGE:
           seen = True
-      if not seen: state.data.agentStates[enemy].configuration = None
+      if not seen: state.data.setAgentConfiguration(enemy, None)
     return state
 
   def __eq__( self, other ):
@@ -312,6 +394,9 @@ class GameState:
     Creates an initial game state from a layout array (see layout.py).
     """
     self.data.initialize(layout, numAgents)
+    # Food changes every few moves and is copied with every successor, so
+    # keep it in the int-backed grid where copies and hashes are O(1)-ish
+    self.data.food = BitGrid.fromGrid(self.data.food)
     positions = [a.configuration for a in self.data.agentStates]
     self.blueTeam = [i for i,p in enumerate(positions) if not self.isRed(p)]
     self.redTeam = [i for i,p in enumerate(positions) if self.isRed(p)]
@@ -330,6 +415,12 @@ class GameState:
 
 def halfGrid(grid, red):
   halfway = grid.width / 2
+  if isinstance(grid, BitGrid):
+    # The red half is the low int(halfway) columns, i.e. the low bits
+    mask = (1 << (int(halfway) * grid.height)) - 1
+    if red: return BitGrid(grid.width, grid.height, bits = grid.bits & mask)
+    else:   return BitGrid(grid.width, grid.height, bits = grid.bits & ~mask)
+
   halfgrid = Grid(grid.width, grid.height, False)
   if red:    xrange = list(range(int(halfway)))
   else:       xrange = list(range(int(halfway), grid.width))
@@ -348,6 +439,48 @@ def halfList(l, grid, red):
     elif not red and x > halfway: newList.append((x,y))
   return newList
 
+_dumpOrders = {}
+
+def dumpOrder(radius):
+  """
+  The offsets of the cells within radius of a dying pacman, in the order
+  dumpFoodFromDeath's breadth-first search over the 8 neighbours of each
+  cell (walls included) visits them.
+  """
+  order = _dumpOrders.get(radius)
+  if order is None:
+    order = []
+    positionQueue = deque([(0, 0)])
+    seen = set([(0, 0)])
+    while positionQueue:
+      x, y = positionQueue.popleft()
+      order.append((x, y))
+      for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+          successor = (x + dx, y + dy)
+          if successor not in seen and abs(x + dx) <= radius and abs(y + dy) <= radius:
+            seen.add(successor)
+            positionQueue.append(successor)
+    order = _dumpOrders[radius] = tuple(order)
+  return order
+
+_dumpCells = {}
+
+def dumpCells(layout, isRed):
+  """
+  The cells food may be dumped on when a pacman dies on the red (or blue)
+  side: inside the border, not walls, and on that side of the grid.
+  Shared between all layouts with the same walls.
+  """
+  key = (layout.getWallFingerprint(), isRed)
+  cells = _dumpCells.get(key)
+  if cells is None:
+    width, height, walls = layout.width, layout.height, layout.walls
+    cells = frozenset((x, y) for x in range(1, width) for y in range(1, height)
+                      if not walls[x][y] and (x < width / 2) == isRed)
+    _dumpCells[key] = cells
+  return cells
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
@@ -391,15 +524,8 @@ class CaptureRules:
     if state.isOver():
       game.gameOver = True
       if not game.rules.quiet:
-        redCount = 0
-        blueCount = 0
+        redCount, blueCount = state.data.returnedFood
         foodToWin = (TOTAL_FOOD/2) - MIN_FOOD
-        for index in range(state.getNumAgents()):
-          agentState = state.data.agentStates[index]
-          if index in state.getRedTeamIndices():
-            redCount += agentState.numReturned
-          else:
-            blueCount += agentState.numReturned
         
         if blueCount >= foodToWin:#state.getRedFood().count() == MIN_FOOD:
           print('The Blue team has returned at least %d of the opponents\' dots.' % foodToWin)
@@ -425,9 +551,11 @@ class CaptureRules:
     if agentIndex % 2 == 0:
       print("Red agent crashed", file=sys.stderr)
       game.state.data.score = -1
+      game.state.data.rehash()
     else:
       print("Blue agent crashed", file=sys.stderr)
       game.state.data.score = 1
+      game.state.data.rehash()
 
   def getMaxTotalTime(self, agentIndex):
     return 900  # Move limits should prevent this from ever happening
@@ -455,7 +583,13 @@ class AgentRules:
     """
     agentState = state.getAgentState(agentIndex)
     conf = agentState.configuration
-    possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+    # Agents on a cell use the layout's precomputed table; half-step
+    # positions fall back to the general rule
+    possibleActions = state.data.layout.getLegalActionTable().get(conf.pos)
+    if possibleActions is None:
+      possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
+    else:
+      possibleActions = list(possibleActions)
     return AgentRules.filterForAllowedActions( agentState, possibleActions)
   getLegalActions = staticmethod( getLegalActions )
 
@@ -468,12 +602,14 @@ class AgentRules:
     """
     Edits the state to reflect the results of the action.
     """
-    legal = AgentRules.getLegalActions( state, agentIndex )
+    legal = state.data.layout.getLegalActionTable().get(state.data.agentStates[agentIndex].configuration.pos)
+    if legal is None:
+      legal = AgentRules.getLegalActions( state, agentIndex )
     if action not in legal:
       raise Exception("Illegal action " + str(action))
 
     # Update Configuration
-    agentState = state.data.agentStates[agentIndex]
+    agentState = state.data.getMutableAgentState(agentIndex)
     speed = 1.0
     # if agentState.isPacman: speed = 0.5
     vector = Actions.directionToVector( action, speed )
@@ -495,18 +631,16 @@ class AgentRules:
         state.data.scoreChange += score
 
         agentState.numReturned += agentState.numCarrying
+        AgentRules.changeTeamFood(state, isRed, -agentState.numCarrying, agentState.numCarrying)
         agentState.numCarrying = 0
 
-        redCount = 0
-        blueCount = 0
-        for index in range(state.getNumAgents()):
-          agentState = state.data.agentStates[index]
-          if index in state.getRedTeamIndices():
-            redCount += agentState.numReturned
-          else:
-            blueCount += agentState.numReturned
+        redCount, blueCount = state.data.returnedFood
         if redCount >= (TOTAL_FOOD/2) - MIN_FOOD or blueCount >= (TOTAL_FOOD/2) - MIN_FOOD:
           state.data._win = True
+        # The eat check below has always looked at the last agent after a
+        # return (a loop over all agents used to rebind agentState); keep it
+        # so that recorded games replay identically
+        agentState = state.data.agentStates[-1]
 
 
     if agentState.isPacman and manhattanDistance( nearest, next ) <= 0.9 :
@@ -514,30 +648,41 @@ class AgentRules:
 
   applyAction = staticmethod( applyAction )
 
+  def changeTeamFood( state, isRed, carried, returned ):
+    "Adds to the running (red, blue) totals of carried and returned food"
+    redCarried, blueCarried = state.data.carriedFood
+    redReturned, blueReturned = state.data.returnedFood
+    if isRed:
+      state.data.carriedFood = (redCarried + carried, blueCarried)
+      state.data.returnedFood = (redReturned + returned, blueReturned)
+    else:
+      state.data.carriedFood = (redCarried, blueCarried + carried)
+      state.data.returnedFood = (redReturned, blueReturned + returned)
+  changeTeamFood = staticmethod( changeTeamFood )
+
   def consume( position, state, isRed ):
     x,y = position
     # Eat food
     if state.data.food[x][y]:
 
       # blue case is the default
-      teamIndicesFunc = state.getBlueTeamIndices
+      team = state.blueTeam
       score = -1
       if isRed:
         # switch if its red
         score = 1
-        teamIndicesFunc = state.getRedTeamIndices
+        team = state.redTeam
 
       # go increase the variable for the pacman who ate this
-      agents = [state.data.agentStates[agentIndex] for agentIndex in teamIndicesFunc()]
-      for agent in agents:
-        if agent.getPosition() == position:
-          agent.numCarrying += 1
+      for agentIndex in team:
+        if state.data.agentStates[agentIndex].getPosition() == position:
+          state.data.getMutableAgentState(agentIndex).numCarrying += 1
+          AgentRules.changeTeamFood(state, isRed, 1, 0)
           break # the above should only be true for one agent...
 
       # do all the score and food grid maintainenace 
       #state.data.scoreChange += score
-      state.data.food = state.data.food.copy()
-      state.data.food[x][y] = False
+      state.data.getMutableFood()[x][y] = False
       state.data._foodEaten = position
       #if (isRed and state.getBlueFood().count() == MIN_FOOD) or (not isRed and state.getRedFood().count() == MIN_FOOD):
       #  state.data._win = True
@@ -546,21 +691,21 @@ class AgentRules:
     if isRed: myCapsules = state.getBlueCapsules()
     else: myCapsules = state.getRedCapsules()
     if( position in myCapsules ):
-      state.data.capsules.remove( position )
+      state.data.getMutableCapsules().remove( position )
       state.data._capsuleEaten = position
 
       # Reset all ghosts' scared timers
       if isRed: otherTeam = state.getBlueTeamIndices()
       else: otherTeam = state.getRedTeamIndices()
       for index in otherTeam:
-        state.data.agentStates[index].scaredTimer = SCARED_TIME
+        state.data.getMutableAgentState(index).scaredTimer = SCARED_TIME
 
   consume = staticmethod( consume )
 
   def decrementTimer(state):
     timer = state.scaredTimer
     if timer == 1:
-      state.configuration.pos = nearestPoint( state.configuration.pos )
+      state.configuration = Configuration( nearestPoint( state.configuration.pos ), state.configuration.direction )
     state.scaredTimer = max( 0, timer - 1 )
   decrementTimer = staticmethod( decrementTimer )
 
@@ -588,85 +733,44 @@ class AgentRules:
     scoreDirection = (-1)**(int(isRed) + 1)
     #state.data.scoreChange += scoreDirection * agentState.numCarrying
 
-    def onRightSide(state, x, y):
-      dummyConfig = Configuration((x, y), 'North')
-      return state.isRed(dummyConfig) == isRed
-
     # we have food to dump
-    # -- expand out in BFS. Check:
-    #   - that it's within the limits
-    #   - that it's not a wall
-    #   - that no other agents are there
-    #   - that no power pellets are there
-    #   - that it's on the right side of the grid
-    def allGood(state, x, y):
-      width, height = state.data.layout.width, state.data.layout.height
-      food, walls = state.data.food, state.data.layout.walls
-
-      # bounds check
-      if x >= width or y >= height or x <= 0 or y <= 0:
-        return False
-
-      if walls[x][y]:
-        return False
-      if food[x][y]:
-        return False
-
-      # dots need to be on the side where this agent will be a pacman :P
-      if not onRightSide(state, x, y):
-        return False
-
-      if (x,y) in state.data.capsules:
-        return False
-
-      # loop through agents
-      agentPoses = [state.getAgentPosition(i) for i in range(state.getNumAgents())]
-      if (x,y) in agentPoses:
-        return False
-
-      return True
-
+    # -- expand out in BFS over the 8 neighbours, placing a dot on each cell
+    # that is within the limits, not a wall, on the right side of the grid
+    # (all precomputed in dumpCells) and free of food, power pellets and agents
     numToDump = agentState.numCarrying
-    state.data.food = state.data.food.copy()
+    food = state.data.getMutableFood()
+    candidates = dumpCells(state.data.layout, isRed)
+    occupied = set(state.data.capsules)
+    occupied.update([state.getAgentPosition(i) for i in range(state.getNumAgents())])
     foodAdded = []
 
-    def genSuccessors(x, y):
-      DX = [-1, 0, 1]
-      DY = [-1, 0, 1]
-      return [(x + dx, y + dy) for dx in DX for dy in DY]
-
-    # BFS graph search
-    positionQueue = [agentState.getPosition()]
-    seen = set()
-    while numToDump > 0:
-      if not len(positionQueue):
-        raise Exception('Exhausted BFS! uh oh')
-      # pop one off, graph check
-      popped = positionQueue.pop(0)
-      if popped in seen:
-        continue
-      seen.add(popped)
-
-      x, y = popped[0], popped[1]
-      x = int(x)
-      y = int(y)
-      if (allGood(state, x, y)):
-        state.data.food[x][y] = True
-        foodAdded.append((x, y))
+    # BFS graph search.  The search ignores walls, so the order it visits
+    # cells in depends only on their offset from the start: walk the
+    # precomputed order instead of running a queue for every death
+    x, y = agentState.getPosition()
+    x = int(x)
+    y = int(y)
+    width, height = state.data.layout.width, state.data.layout.height
+    for dx, dy in dumpOrder(max(width, height)):
+      cell = (x + dx, y + dy)
+      if cell in candidates and cell not in occupied and not food[cell[0]][cell[1]]:
+        food[cell[0]][cell[1]] = True
+        foodAdded.append(cell)
         numToDump -= 1
-
-      # generate successors
-      positionQueue = positionQueue + genSuccessors(x, y)
+        if numToDump == 0: break
+    else:
+      raise Exception('Exhausted BFS! uh oh')
 
     state.data._foodAdded = foodAdded
-    # now our agentState is no longer carrying food
+    # now our agentState is no longer carrying food; it died on the other
+    # team's side, so it is on team (not isRed)
+    AgentRules.changeTeamFood(state, not isRed, -agentState.numCarrying, 0)
     agentState.numCarrying = 0
-    pass
 
   dumpFoodFromDeath = staticmethod(dumpFoodFromDeath)
 
   def checkDeath( state, agentIndex):
-    agentState = state.data.agentStates[agentIndex]
+    agentState = state.data.getMutableAgentState(agentIndex)
     if state.isOnRedTeam(agentIndex):
       otherTeam = state.getBlueTeamIndices()
     else:
@@ -678,6 +782,7 @@ class AgentRules:
         ghostPosition = otherAgentState.getPosition()
         if ghostPosition == None: continue
         if manhattanDistance( ghostPosition, agentState.getPosition() ) <= COLLISION_TOLERANCE:
+          otherAgentState = state.data.getMutableAgentState(index)
           # award points to the other team for killing Pacmen
           if otherAgentState.scaredTimer <= 0:
             AgentRules.dumpFoodFromDeath(state, agentState, agentIndex)
@@ -704,6 +809,7 @@ class AgentRules:
         pacPos = otherAgentState.getPosition()
         if pacPos == None: continue
         if manhattanDistance( pacPos, agentState.getPosition() ) <= COLLISION_TOLERANCE:
+          otherAgentState = state.data.getMutableAgentState(index)
           #award points to the other team for killing Pacmen
           if agentState.scaredTimer <= 0:
             AgentRules.dumpFoodFromDeath(state, otherAgentState, agentIndex)
@@ -804,10 +910,20 @@ def readCommand( argv ):
                     help='Writes game histories to a file (named by the time they were played)', default=False)
   parser.add_option('--replay', default=None,
                     help='Replays a recorded game file.')
+  parser.add_option('--replay-from', dest='replay_from', type='int', default=0, metavar='MOVE',
+                    help='Starts the replay after this many moves, from the nearest keyframe [Default: %default]')
+  parser.add_option('--keyframes', type='int', default=0, metavar='K',
+                    help='Embeds the game state every K moves in recorded games, for seeking (0 for none) [Default: %default]')
   parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
                     help=default('How many episodes are training (suppresses output)'), default=0)
   parser.add_option('-c', '--catchExceptions', action='store_true', default=False,
                     help='Catch exceptions and enforce time limits')
+  parser.add_option('--workers', type='int', default=0,
+                    help=default('Play the games on this many worker processes, without graphics (0 plays them here)'))
+  parser.add_option('--ratings', default=None, metavar='DB',
+                    help='Adds every game played to this ratings.py database')
+  parser.add_option('--distance-cache', dest='distance_cache', default=None, metavar='DIR',
+                    help='Directory for cached maze distance tables, shared between processes (or set $PACMAN_DISTANCE_CACHE)')
 
   options, otherjunk = parser.parse_args(argv)
   assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
@@ -827,6 +943,10 @@ def readCommand( argv ):
     import textDisplay
     args['display'] = textDisplay.NullGraphics()
     args['muteAgents'] = True
+  elif options.workers > 0:
+    # Worker processes play without graphics
+    import textDisplay
+    args['display'] = textDisplay.NullGraphics()
   else:
     import captureGraphicsDisplay
     # Hack for agents writing to the display
@@ -841,13 +961,29 @@ def readCommand( argv ):
 
   if options.fixRandomSeed: random.seed('cs188')
 
+  if options.distance_cache:
+    import distanceCalculator
+    distanceCalculator.setCacheDirectory(options.distance_cache)
+
   # Special case: recorded games don't use the runGames method or args structure
   if options.replay != None:
     print('Replaying recorded game %s.' % options.replay)
-    import pickle
-    recorded = pickle.load(open(options.replay))
-    recorded['display'] = args['display']
-    replayGame(**recorded)
+    import replay
+    if replay.isReplayFile(options.replay):
+      with replay.readReplay(options.replay) as recorded:
+        if options.replay_from > 0:
+          replayGameFrom(recorded, options.replay_from, args['display'])
+        else:
+          replayGame(display=args['display'], **recorded.components())
+    else:
+      # Replays recorded before the binary format.  Their pickled Layout
+      # predates frozen walls and cached tables, so use the interned one
+      import pickle, layout
+      with open(options.replay, 'rb') as f:
+        recorded = pickle.load(f)
+      recorded['layout'] = layout.internLayout(recorded['layout'].layoutText)
+      recorded['display'] = args['display']
+      replayGame(**recorded)
     sys.exit(0)
 
   # Choose a pacman agent
@@ -873,15 +1009,22 @@ def readCommand( argv ):
       raise Exception('Max of two keyboard agents supported')
     numKeyboardAgents += 1
     args['agents'][index] = agent
+  args['teams'] = ((options.red, redArgs), (options.blue, blueArgs))
+  if options.workers > 0:
+    if numKeyboardAgents > 0: raise Exception('Keyboard agents cannot play on worker processes')
+    args['workers'] = options.workers
+  if options.ratings:
+    if numKeyboardAgents > 0: raise Exception('Games with keyboard agents cannot be rated')
+    args['ratingsPath'] = options.ratings
 
   # Choose a layout
   import layout
   layouts = []
   for i in range(options.numGames):
     if options.layout == 'RANDOM':
-      l = layout.Layout(randomLayout().split('\n'))
+      l = layout.internLayout(randomLayout().split('\n'))
     elif options.layout.startswith('RANDOM'):
-      l = layout.Layout(randomLayout(int(options.layout[6:])).split('\n'))
+      l = layout.internLayout(randomLayout(int(options.layout[6:])).split('\n'))
     elif options.layout.lower().find('capture') == -1:
       raise Exception( 'You must use a capture layout with capture.py')
     else:
@@ -891,10 +1034,12 @@ def readCommand( argv ):
     layouts.append(l)
     
   args['layouts'] = layouts
+  args['layoutNames'] = [options.layout] * options.numGames
   args['length'] = options.time
   args['numGames'] = options.numGames
   args['numTraining'] = options.numTraining
   args['record'] = options.record
+  args['keyframes'] = options.keyframes
   args['catchExceptions'] = options.catchExceptions
   return args
 
@@ -959,7 +1104,37 @@ def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamN
 
     display.finish()
 
-def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False ):
+def replayGameFrom( recorded, move, display ):
+  """
+  Replays a replay.Replay from move onwards; the state there is rebuilt from
+  the nearest keyframe rather than by playing every earlier move.
+  """
+  import replay
+  cursor = replay.ReplayCursor(recorded)
+  state = cursor.seek(move)
+  rules = CaptureRules()
+  game = rules.newGame( recorded.getLayout(), [Agent() for i in range(recorded.numAgents)], display, recorded.length, False, False )
+  display.redTeam = recorded.redTeamName
+  display.blueTeam = recorded.blueTeamName
+  display.initialize(state.data)
+
+  while cursor.step():
+    state = cursor.state
+    display.update( state.data )
+    rules.process(state, game)
+
+  display.finish()
+
+def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, teams=None, workers=0, keyframes=0, layoutNames=None, ratingsPath=None ):
+  """
+  Plays the games here (returning the Game objects) or, with workers, on a
+  process pool (returning result records).  With ratingsPath, every game
+  that is not a training game is also added to that ratings.py database;
+  games played here are then seeded one by one like the pool's, so each
+  rated game has a seed that identifies it.
+  """
+  if workers > 0:
+    return runParallelGames( layouts, teams, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents, catchExceptions, workers, keyframes, layoutNames, ratingsPath )
 
   rules = CaptureRules()
   games = []
@@ -978,36 +1153,142 @@ def runGames( layouts, agents, display, length, numGames, record, numTraining, r
     else:
         gameDisplay = display
         rules.quiet = False
+    seed = None
+    if ratingsPath:
+      seed = random.randint(0, 2**31 - 1)
+      random.seed( seed )
     g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions )
     g.run()
     if not beQuiet: games.append(g)
+    if ratingsPath and not beQuiet:
+      rateGames( ratingsPath, [gameIdentity({'seed': seed, 'score': g.state.data.score, 'moves': len(g.moveHistory)},
+                                            teams, layout, layoutNames and layoutNames[i])] )
 
     g.record = None
     if record:
-      import time, pickle, game
-      #fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-      #f = file(fname, 'w')
-      components = {'layout': layout, 'agents': [game.Agent() for a in agents], 'actions': g.moveHistory, 'length': length, 'redTeamName': redTeamName, 'blueTeamName':blueTeamName }
-      #f.close()
+      import replay
       print("recorded")
-      g.record = pickle.dumps(components)
-      with open('replay-%d'%i,'wb') as f:
-        f.write(g.record)
+      g.record = replay.writeReplay('replay-%d'%i, layout.layoutText, g.moveHistory, length, redTeamName, blueTeamName, len(agents), keyframeInterval=keyframes)
 
   if numGames > 1:
-    scores = [game.state.data.score for game in games]
-    redWinRate = [s > 0 for s in scores].count(True)/ float(len(scores))
-    blueWinRate = [s < 0 for s in scores].count(True)/ float(len(scores))
-    print('Average Score:', sum(scores) / float(len(scores)))
-    print('Scores:       ', ', '.join([str(score) for score in scores]))
-    print('Red Win Rate:  %d/%d (%.2f)' % ([s > 0 for s in scores].count(True), len(scores), redWinRate))
-    print('Blue Win Rate: %d/%d (%.2f)' % ([s < 0 for s in scores].count(True), len(scores), blueWinRate))
-    print('Record:       ', ', '.join([('Blue', 'Tie', 'Red')[max(0, min(2, 1 + s))] for s in scores]))
+    printSummary([game.state.data.score for game in games])
   return games
 
+def printSummary(scores):
+  "Prints the average score, win rates and record of a series of games"
+  redWinRate = [s > 0 for s in scores].count(True)/ float(len(scores))
+  blueWinRate = [s < 0 for s in scores].count(True)/ float(len(scores))
+  print('Average Score:', sum(scores) / float(len(scores)))
+  print('Scores:       ', ', '.join([str(score) for score in scores]))
+  print('Red Win Rate:  %d/%d (%.2f)' % ([s > 0 for s in scores].count(True), len(scores), redWinRate))
+  print('Blue Win Rate: %d/%d (%.2f)' % ([s < 0 for s in scores].count(True), len(scores), blueWinRate))
+  print('Record:       ', ', '.join([('Blue', 'Tie', 'Red')[max(0, min(2, 1 + s))] for s in scores]))
+
+def gameIdentity( result, teams, layout, layoutName = None ):
+  """
+  Adds what ratings.py identifies a game by to a result record: the red
+  and blue team modules and the hashes of their files, the layout name
+  (the fingerprint if none is given) and the wall fingerprint.
+  """
+  import ratings
+  (redTeam, redArgs), (blueTeam, blueArgs) = teams
+  result['red'] = redTeam[:-3] if redTeam.endswith('.py') else redTeam
+  result['blue'] = blueTeam[:-3] if blueTeam.endswith('.py') else blueTeam
+  result['redHash'], result['blueHash'] = ratings.teamHash(redTeam), ratings.teamHash(blueTeam)
+  result['fingerprint'] = layout.getWallFingerprint()
+  result['layout'] = layoutName or result['fingerprint']
+  return result
+
+def rateGames( ratingsPath, results ):
+  "Adds result records carrying a gameIdentity to a ratings.py database"
+  import ratings
+  store = ratings.RatingStore(ratingsPath)
+  try:
+    for result in results:
+      store.addResult(result)
+  finally:
+    store.close()
+
+def runParallelGames( layouts, teams, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents, catchExceptions, workers, keyframes=0, layoutNames=None, ratingsPath=None ):
+  """
+  Plays the games on a pool of worker processes.  teams is ((redTeam,
+  redArgs), (blueTeam, blueArgs)); every game loads fresh agents and takes a
+  seed drawn here from the parent's random stream, so with --fixRandomSeed
+  the results do not depend on the number of workers.  Returns the result
+  records (see playGameRecord) of the non-training games.
+  """
+  import multiprocessing
+  tasks = []
+  for i in range( numGames ):
+    tasks.append({'index': i, 'seed': random.randint(0, 2**31 - 1), 'layoutText': layouts[i].layoutText,
+                  'teams': teams, 'length': length, 'muteAgents': muteAgents,
+                  'catchExceptions': catchExceptions, 'record': record})
+
+  if numTraining > 0:
+    print('Playing %d training games' % numTraining)
+
+  results = []
+  with multiprocessing.Pool( min(workers, numGames) ) as pool:
+    for result in pool.imap( playGameRecord, tasks ):
+      i = result['index']
+      if record:
+        import replay
+        print("recorded")
+        replay.writeReplay('replay-%d'%i, layouts[i].layoutText, result['actions'], length, redTeamName, blueTeamName, len(result['agentTimes']), result['seed'], keyframes)
+      if i < numTraining: continue
+      score = result['score']
+      if score == 0: outcome = 'Tie game'
+      else: outcome = 'The %s team wins by %d points' % (score > 0 and 'Red' or 'Blue', abs(score))
+      print('Game %d: %s after %d moves.' % (i + 1, outcome, result['moves']))
+      results.append(gameIdentity(result, teams, layouts[i], layoutNames and layoutNames[i]))
+
+  if ratingsPath:
+    rateGames(ratingsPath, results)
+
+  if len(results) > 1:
+    printSummary([result['score'] for result in results])
+  return results
+
+def playGameRecord( task ):
+  """
+  Plays one game of a runParallelGames task in a worker process, with its
+  output muted, and returns a compact record of it: index, seed, score,
+  moves, crashed, timedOut, agentTimes (seconds in each agent's getAction),
+  agentMoves (getAction calls per agent) and, when recording, actions.
+  """
+  import layout, textDisplay
+  util.mutePrint()
+  try:
+    random.seed( task['seed'] )
+    (redTeam, redArgs), (blueTeam, blueArgs) = task['teams']
+    agents = sum([list(el) for el in zip(loadAgents(True, redTeam, True, redArgs), loadAgents(False, blueTeam, True, blueArgs))],[])
+    agentTimes = [0.0 for agent in agents]
+    agentMoves = [0 for agent in agents]
+    def timeActions(index, getAction):
+      def timedGetAction(state):
+        start = time.perf_counter()
+        try:
+          return getAction(state)
+        finally:
+          agentTimes[index] += time.perf_counter() - start
+          agentMoves[index] += 1
+      return timedGetAction
+    for index, agent in enumerate(agents):
+      if agent is not None: agent.getAction = timeActions(index, agent.getAction)
+    rules = CaptureRules( quiet = True )
+    g = rules.newGame( layout.internLayout(task['layoutText']), agents, textDisplay.NullGraphics(), task['length'], task['muteAgents'], task['catchExceptions'] )
+    g.run()
+  finally:
+    util.unmutePrint()
+  return {'index': task['index'], 'seed': task['seed'], 'score': g.state.data.score, 'moves': len(g.moveHistory),
+          'crashed': g.agentCrashed, 'timedOut': g.agentTimeout, 'agentTimes': agentTimes,
+          'agentMoves': agentMoves, 'actions': task['record'] and g.moveHistory or None}
+
 def save_score(game):
+    "Writes the score of a Game (or of a runParallelGames result record)"
+    score = game['score'] if isinstance(game, dict) else game.state.data.score
     with open('score', 'w') as f:
-        print(game.state.data.score, file=f)
+        print(score, file=f)
 
 if __name__ == '__main__':
   """
@@ -18,6 +18,7 @@
 
 from game import Agent
 import distanceCalculator
+import inference
 from util import nearestPoint
 import util
 
@@ -51,6 +52,10 @@ class CaptureAgent(Agent):
   Recommended Usage:  Subclass CaptureAgent and override chooseAction.
   """
 
+  # Seconds of registerInitialState spent on maze distances (the startup
+  # limit is 15); whatever is left is computed timeForComputing per turn
+  startupTimeForComputing = 10.0
+
   #############################
   # Methods to store key info #
   #############################
@@ -102,7 +107,7 @@ class CaptureAgent(Agent):
     self.distancer = distanceCalculator.Distancer(gameState.data.layout)
 
     # comment this out to forgo maze distance computation and use manhattan distances
-    self.distancer.getMazeDistances()
+    self.distancer.computeMazeDistances(self.startupTimeForComputing)
 
     import __main__
     if '_display' in dir(__main__):
@@ -153,6 +158,10 @@ class CaptureAgent(Agent):
     """
     self.observationHistory.append(gameState)
 
+    # Keep filling in maze distances on huge layouts that did not finish at startup
+    if self.distancer is not None and not self.distancer.isReadyForMazeDistance():
+      self.distancer.computeMazeDistances(self.timeForComputing)
+
     myState = gameState.getAgentState(self.index)
     myPos = myState.getPosition()
     if myPos != nearestPoint(myPos):
@@ -247,6 +256,28 @@ class CaptureAgent(Agent):
     d = self.distancer.getDistance(pos1, pos2)
     return d
 
+  def getMazeDistances(self, pos, targets):
+    """
+    Returns the list of distances from pos to each position in targets,
+    computed in one pass over the distancer's table.  Prefer this to calling
+    getMazeDistance in a loop.
+    """
+    return self.distancer.getDistances(pos, targets)
+
+  def getClosestByMazeDistance(self, pos, targets):
+    """
+    Returns (target, distance) for the position in targets closest to pos,
+    or (None, None) if targets is empty.  Ties go to the earliest target.
+    """
+    return self.distancer.nearest(pos, targets)
+
+  def getMazeDistanceMatrix(self, sources, targets):
+    """
+    Returns one list per position in sources holding its distance to each
+    position in targets.
+    """
+    return self.distancer.distanceMatrix(sources, targets)
+
   def getPreviousObservation(self):
     """
     Returns the GameState object corresponding to the last state this agent saw
@@ -271,7 +302,8 @@ class CaptureAgent(Agent):
 
     The arg distributions is a tuple or list of util.Counter objects, where the i'th
     Counter has keys that are board positions (x,y) and values that encode the probability
-    that agent i is at (x,y).
+    that agent i is at (x,y).  inference.BeliefGrid objects are accepted in place of
+    Counters, so inference.EnemyBeliefs.getDistributions() can be passed directly.
 
     If some elements are None, then they will be ignored.  If a Counter is passed to this
     function, it will be displayed. This is helpful for figuring out if your agent is doing
@@ -280,7 +312,7 @@ class CaptureAgent(Agent):
     dists = []
     for dist in distributions:
       if dist != None:
-        if not isinstance(dist, util.Counter): raise Exception("Wrong type of distribution")
+        if not isinstance(dist, (util.Counter, inference.BeliefGrid)): raise Exception("Wrong type of distribution")
         dists.append(dist)
       else:
         dists.append(util.Counter())
@@ -21,20 +21,38 @@ distancer = Distancer(gameState.data.layout)
 distancer.getDistance( (1,1), (10,10) )
 """
 
-import sys, time, random
+import sys, time, random, os, struct, mmap, zlib, threading
+from array import array
+from collections import OrderedDict
 
 class Distancer:
-  def __init__(self, layout, default = 10000):
+  def __init__(self, layout, default = 10000, lazy = False, maxCacheBytes = None):
     """
     Initialize with Distancer(layout).  Changing default is unnecessary.
+
+    With lazy=True, getMazeDistances does not precompute all pairs: rows are
+    computed the first time a source is queried and kept in an LRU limited
+    to maxCacheBytes (unless a full table is already in memory or on disk).
     """
     self._distances = None
     self.default = default
+    self.lazy = lazy
+    self.maxCacheBytes = maxCacheBytes
     self.dc = DistanceCalculator(layout, self, default)
 
   def getMazeDistances(self):
     self.dc.run()
 
+  def computeMazeDistances(self, timeLimit):
+    """
+    Works on the maze distances for at most (roughly) timeLimit seconds,
+    picking up where the previous call stopped; every Distancer on the
+    same walls works on (and reads) one shared table.  Queries made before the
+    table is complete use exact distances for the rows computed so far and
+    Manhattan distance otherwise.  Returns True once every row is done.
+    """
+    return self.dc.runFor(timeLimit)
+
   def getDistance(self, pos1, pos2):
     """
     The getDistance function is the only one you'll need after you create the object.
@@ -55,14 +73,68 @@ class Distancer:
     return bestDistance
 
   def getDistanceOnGrid(self, pos1, pos2):
-    key = (pos1, pos2)
-    if key in self._distances:
-      return self._distances[key]
-    else:
-      raise Exception("Positions not in grid: " + str(key))
+    return self._distances.getDistance(pos1, pos2)
+
+  def getDistances(self, pos, targets):
+    """
+    Returns a list with the distance from pos to each of targets.  When pos
+    and every target are grid positions this reads one row of the distance
+    table in a single pass instead of one lookup per pair.
+    """
+    table = self._distances
+    if table is not None:
+      index = table.cellIndex
+      try:
+        source = index[pos]
+        cells = list(map(index.__getitem__, targets))
+      except (KeyError, TypeError):
+        pass
+      else:
+        distances = list(map(table.cellRow(source).__getitem__, cells))
+        if UNREACHABLE in distances:
+          distances = [sys.maxsize if d == UNREACHABLE else d for d in distances]
+        return distances
+    return [self.getDistance(pos, target) for target in targets]
+
+  def nearest(self, pos, targets):
+    """
+    Returns (target, distance) for the target closest to pos, preferring the
+    earliest one on ties, or (None, None) if there are no targets.
+    """
+    targets = list(targets)
+    if len(targets) == 0:
+      return None, None
+    distances = self.getDistances(pos, targets)
+    best = distances.index(min(distances))
+    return targets[best], distances[best]
+
+  def distanceMatrix(self, sources, targets):
+    """
+    Returns a list of rows, one per source, holding the distance to each
+    of targets.
+    """
+    targets = list(targets)
+    return [self.getDistances(source, targets) for source in sources]
 
   def isReadyForMazeDistance(self):
-    return self._distances != None
+    return self._distances != None and not isinstance(self._distances, IncrementalDistanceTable)
+
+  def getMazeDistanceProgress(self):
+    "Returns the fraction (0 to 1) of maze distance rows computed so far"
+    if self._distances == None:
+      return 0.0
+    if isinstance(self._distances, IncrementalDistanceTable):
+      return self._distances.getProgress()
+    return 1.0
+
+  def getCacheStats(self):
+    """
+    Returns the hit/miss/eviction counters of a lazy distancer's row cache,
+    or None when distances come from a full table.
+    """
+    if isinstance(self._distances, LazyDistanceTable):
+      return self._distances.getStats()
+    return None
 
 def manhattanDistance(x, y ):
   return abs( x[0] - y[0] ) + abs( x[1] - y[1] )
@@ -88,7 +160,80 @@ def getGrids1D(x):
 # MACHINERY FOR COMPUTING MAZE DISTANCES #
 ##########################################
 
+# Marks cell pairs with no path between them (stored in the int16 matrix)
+UNREACHABLE = -1
+
+# Process-wide registry of DistanceTables keyed by wall fingerprint.  Every
+# Distancer on the same walls (any agent, any team, any game) shares one
+# read-only table.
 distanceMap = {}
+_registryLock = threading.Lock()
+
+# Tables still being filled in by computeMazeDistances, also keyed by wall
+# fingerprint, so every agent on a maze advances and reads the same one
+incrementalMap = {}
+
+def getDistanceTable(layout):
+  """
+  Returns the shared DistanceTable for a layout's walls, computing (or
+  loading from the disk cache) the first time a maze is seen.
+  """
+  fingerprint = layoutFingerprint(layout)
+  table = distanceMap.get(fingerprint)
+  if table is None:
+    with _registryLock:
+      table = distanceMap.get(fingerprint)
+      if table is None:
+        if getCacheDirectory():
+          table = loadOrComputeDistances(layout)
+        else:
+          table = computeDistances(layout)
+        distanceMap[fingerprint] = table
+  return table
+
+def registerDistanceTable(layout, table):
+  """
+  Shares a finished table (and saves it to the disk cache, if configured);
+  returns the registered one if another agent won the race.
+  """
+  if getCacheDirectory():
+    try:
+      writeDistanceFile(cacheFileName(layout.walls), layout.walls, table.matrix)
+    except (IOError, OSError):
+      pass
+  fingerprint = layoutFingerprint(layout)
+  with _registryLock:
+    incrementalMap.pop(fingerprint, None)
+    return distanceMap.setdefault(fingerprint, table)
+
+def getIncrementalTable(layout):
+  "Returns the shared IncrementalDistanceTable for a layout's walls"
+  fingerprint = layoutFingerprint(layout)
+  with _registryLock:
+    table = incrementalMap.get(fingerprint)
+    if table is None:
+      table = incrementalMap[fingerprint] = IncrementalDistanceTable(layout.walls)
+  return table
+
+def getCachedDistanceTable(layout):
+  """
+  Returns the full DistanceTable for a layout if one is already in memory
+  or in the disk cache, without computing anything; None otherwise.
+  """
+  fingerprint = layoutFingerprint(layout)
+  table = distanceMap.get(fingerprint)
+  if table is None and getCacheDirectory():
+    table = readDistanceFile(cacheFileName(layout.walls), layout.walls)
+    if table is not None:
+      with _registryLock:
+        table = distanceMap.setdefault(fingerprint, table)
+  return table
+
+def layoutFingerprint(layout):
+  "Uses the layout's precomputed wall fingerprint when it has one"
+  if hasattr(layout, 'getWallFingerprint'):
+    return layout.getWallFingerprint()
+  return wallFingerprint(layout.walls)
 
 class DistanceCalculator:
   def __init__(self, layout, distancer, default = 10000):
@@ -97,61 +242,360 @@ class DistanceCalculator:
     self.default = default
 
   def run(self):
-    global distanceMap
-
-    if self.layout.walls not in distanceMap:
-      distances = computeDistances(self.layout)
-      distanceMap[self.layout.walls] = distances
+    if self.distancer.lazy:
+      table = getCachedDistanceTable(self.layout)
+      if table is None:
+        table = LazyDistanceTable(self.layout.walls, self.distancer.maxCacheBytes)
+      self.distancer._distances = table
     else:
-      distances = distanceMap[self.layout.walls]
+      self.distancer._distances = getDistanceTable(self.layout)
 
-    self.distancer._distances = distances
+  def runFor(self, timeLimit):
+    deadline = time.perf_counter() + timeLimit
+    if self.distancer.isReadyForMazeDistance():
+      return True
+    # Another agent may have finished (or cached) the table for these walls
+    finished = getCachedDistanceTable(self.layout)
+    if finished is None:
+      table = getIncrementalTable(self.layout)
+      self.distancer._distances = table
+      if table.computeUntil(deadline):
+        finished = registerDistanceTable(self.layout, table.getFinishedTable())
+    if finished is not None:
+      self.distancer._distances = finished
+    return self.distancer.isReadyForMazeDistance()
+
+class DistanceTable:
+  """
+  All-pairs maze distances for one wall layout, stored as a flat int16
+  buffer (a read-only memoryview over an array or a cache file) together
+  with a position -> cell id map.  The distance between cells i and j lives
+  at matrix[i * numCells + j]; UNREACHABLE marks pairs with no path.
+
+  Tables are shared between agents and must be treated as immutable.
+  """
+
+  def __init__(self, cellIndex, matrix):
+    self.cellIndex = cellIndex
+    self.numCells = len(cellIndex)
+    self.matrix = matrix
+
+  def getDistance(self, pos1, pos2):
+    """
+    Returns the maze distance between two grid positions, raising an
+    exception for positions that are walls or off the board.
+    """
+    distance = lookupDistance(self, pos1, pos2)
+    if distance is None:
+      raise Exception("Positions not in grid: " + str((pos1, pos2)))
+    return distance
+
+  def index(self, pos):
+    "Returns the cell id of a grid position (None for walls)"
+    return self.cellIndex.get(pos)
+
+  def row(self, pos):
+    """
+    Returns a read-only int16 view of the distances from pos to every cell,
+    indexed by cell id.  Unreachable cells read as UNREACHABLE.
+    """
+    i = self.cellIndex.get(pos)
+    if i is None:
+      raise Exception("Position not in grid: " + str(pos))
+    return self.cellRow(i)
+
+  def cellRow(self, i):
+    n = self.numCells
+    return self.matrix[i * n:(i + 1) * n]
+
+  def cellDistance(self, i, j):
+    return self.matrix[i * self.numCells + j]
+
+  def memoryUsage(self):
+    "Approximate bytes held by the table (matrix plus position map)"
+    keyBytes = sum(sys.getsizeof(pos) for pos in self.cellIndex)
+    return self.numCells * self.numCells * 2 + sys.getsizeof(self.cellIndex) + keyBytes
+
+# Default memory cap for the rows of a lazy distance table
+DEFAULT_LAZY_CACHE_BYTES = 8 * 1024 * 1024
+
+class LazyDistanceTable(DistanceTable):
+  """
+  A DistanceTable that runs a BFS for a source cell the first time it is
+  queried.  Rows live in an LRU holding at most maxBytes of int16 data; the
+  hits, misses and evictions counters help size the cap for a layout.
+  """
+
+  def __init__(self, walls, maxBytes=None):
+    cellIndex, self.neighbors = buildCellGraph(walls)
+    DistanceTable.__init__(self, cellIndex, None)
+    if maxBytes is None:
+      maxBytes = DEFAULT_LAZY_CACHE_BYTES
+    self.maxBytes = maxBytes
+    self.maxRows = max(1, maxBytes // max(1, 2 * self.numCells))
+    self.rows = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def cellRow(self, i):
+    row = self.rows.get(i)
+    if row is not None:
+      self.hits += 1
+      self.rows.move_to_end(i)
+      return row
+    self.misses += 1
+    row = bfsRow(i, self.neighbors)
+    self.rows[i] = row
+    while len(self.rows) > self.maxRows:
+      self.rows.popitem(last=False)
+      self.evictions += 1
+    return row
+
+  def cellDistance(self, i, j):
+    # Distances are symmetric, so a cached row for either end will do
+    if i not in self.rows and j in self.rows:
+      i, j = j, i
+    return self.cellRow(i)[j]
+
+  def getStats(self):
+    return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            'rows': len(self.rows), 'bytes': 2 * self.numCells * len(self.rows)}
+
+  def memoryUsage(self):
+    keyBytes = sum(sys.getsizeof(pos) for pos in self.cellIndex)
+    return self.getStats()['bytes'] + sys.getsizeof(self.cellIndex) + keyBytes
+
+class IncrementalDistanceTable(DistanceTable):
+  """
+  A DistanceTable filled in a few rows at a time by computeUntil, so the
+  all-pairs computation can be spread over several turns.  Pairs with
+  neither row computed yet fall back to Manhattan distance; queries never
+  compute rows, so all the work stays inside the computeUntil budgets.
+  """
+
+  def __init__(self, walls):
+    cellIndex, self.neighbors = buildCellGraph(walls)
+    n = len(cellIndex)
+    DistanceTable.__init__(self, cellIndex, array('h', [UNREACHABLE]) * (n * n))
+    self.cells = walls.asList(False)
+    self.computed = bytearray(n)
+    self.numComputed = 0
+    self.nextSource = 0
+
+  def computeRow(self, i):
+    n = self.numCells
+    self.matrix[i * n:(i + 1) * n] = bfsRow(i, self.neighbors)
+    self.computed[i] = 1
+    self.numComputed += 1
+
+  def computeUntil(self, deadline):
+    "Computes rows until the time.perf_counter() deadline; True when done"
+    while self.nextSource < self.numCells:
+      if not self.computed[self.nextSource]:
+        self.computeRow(self.nextSource)
+      self.nextSource += 1
+      if time.perf_counter() >= deadline:
+        break
+    return self.numComputed == self.numCells
+
+  def getProgress(self):
+    return self.numComputed / float(max(1, self.numCells))
+
+  def getFinishedTable(self):
+    return DistanceTable(self.cellIndex, memoryview(self.matrix).toreadonly())
+
+  def cellRow(self, i):
+    n = self.numCells
+    if self.computed[i]:
+      return self.matrix[i * n:(i + 1) * n]
+    # Read the computed rows the other way round, approximate the rest
+    matrix, computed, source = self.matrix, self.computed, self.cells[i]
+    return [matrix[j * n + i] if computed[j] else manhattanDistance(source, cell)
+            for j, cell in enumerate(self.cells)]
+
+  def cellDistance(self, i, j):
+    if self.computed[i]:
+      return self.matrix[i * self.numCells + j]
+    if self.computed[j]:
+      return self.matrix[j * self.numCells + i]
+    return manhattanDistance(self.cells[i], self.cells[j])
 
 def computeDistances(layout):
-    "Runs UCS to all other positions from each position"
-    distances = {}
-    allNodes = layout.walls.asList(False)
-    for source in allNodes:
-        dist = {}
-        closed = {}
-        for node in allNodes:
-            dist[node] = sys.maxsize
-        import util
-        queue = util.PriorityQueue()
-        queue.push(source, 0)
-        dist[source] = 0
-        while not queue.isEmpty():
-            node = queue.pop()
-            if node in closed:
-                continue
-            closed[node] = True
-            nodeDist = dist[node]
-            adjacent = []
-            x, y = node
-            if not layout.isWall((x,y+1)):
-                adjacent.append((x,y+1))
-            if not layout.isWall((x,y-1)):
-                adjacent.append((x,y-1) )
-            if not layout.isWall((x+1,y)):
-                adjacent.append((x+1,y) )
-            if not layout.isWall((x-1,y)):
-                adjacent.append((x-1,y))
-            for other in adjacent:
-                if not other in dist:
-                    continue
-                oldDist = dist[other]
-                newDist = nodeDist+1
-                if newDist < oldDist:
-                    dist[other] = newDist
-                    queue.push(other, newDist)
-        for target in allNodes:
-            distances[(target, source)] = dist[target]
-    return distances
+  """
+  Runs a breadth-first search from every open position and returns the
+  results as a DistanceTable.
+  """
+  cellIndex, neighbors = buildCellGraph(layout.walls)
+  numCells = len(neighbors)
+  matrix = array('h', [UNREACHABLE]) * (numCells * numCells)
+  for source in range(numCells):
+    matrix[source * numCells:(source + 1) * numCells] = bfsRow(source, neighbors)
+  return DistanceTable(cellIndex, memoryview(matrix).toreadonly())
 
+def buildCellGraph(walls):
+  """
+  Numbers the open cells of a wall grid (in Grid.asList order) and returns
+  the position -> cell id table along with the neighbor ids of every cell.
+  """
+  cells = walls.asList(False)
+  cellIndex = dict((pos, i) for i, pos in enumerate(cells))
+  neighbors = []
+  for x, y in cells:
+    adjacent = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+    neighbors.append(tuple(cellIndex[other] for other in adjacent if other in cellIndex))
+  return cellIndex, neighbors
 
-def getDistanceOnGrid(distances, pos1, pos2):
-    key = (pos1, pos2)
-    if key in distances:
-      return distances[key]
-    return 100000
+def bfsRow(source, neighbors):
+  "Unit-weight BFS from a single cell, expanding one frontier at a time"
+  row = [UNREACHABLE] * len(neighbors)
+  row[source] = 0
+  frontier = [source]
+  distance = 0
+  while frontier:
+    distance += 1
+    nextFrontier = []
+    for cell in frontier:
+      for other in neighbors[cell]:
+        if row[other] == UNREACHABLE:
+          row[other] = distance
+          nextFrontier.append(other)
+    frontier = nextFrontier
+  return array('h', row)
+
+def lookupDistance(table, pos1, pos2):
+  "Reads a distance out of a DistanceTable; None if either position is off the grid"
+  i = table.cellIndex.get(pos1)
+  j = table.cellIndex.get(pos2)
+  if i is None or j is None:
+    return None
+  distance = table.cellDistance(i, j)
+  if distance == UNREACHABLE:
+    return sys.maxsize
+  return distance
+
+########################################
+# PERSISTENT CACHE OF DISTANCE MATRICES #
+########################################
+
+# Directory holding one distance file per wall layout; the --distance-cache
+# flag of capture.py sets this environment variable for the whole process.
+CACHE_DIRECTORY_ENV = 'PACMAN_DISTANCE_CACHE'
+
+CACHE_MAGIC = b'PMDT'
+CACHE_VERSION = 2
+# magic, version, byte order, width, height, cell count, payload crc32, wall digest
+CACHE_HEADER = struct.Struct('<4sHcxHHII20s')
+
+def getCacheDirectory():
+  return os.environ.get(CACHE_DIRECTORY_ENV) or None
+
+def setCacheDirectory(directory):
+  "Enables (or, given None, disables) the on-disk distance cache"
+  if directory:
+    os.environ[CACHE_DIRECTORY_ENV] = directory
+  else:
+    os.environ.pop(CACHE_DIRECTORY_ENV, None)
 
+def wallFingerprint(walls):
+  """
+  Returns a stable hex digest of a wall grid.  Unlike hash(walls) it is the
+  same in every process, so it can name files shared between workers.
+  """
+  return walls.fingerprint()
+
+def cacheFileName(walls, directory=None):
+  directory = directory or getCacheDirectory()
+  return os.path.join(directory, 'distances-%s.bin' % wallFingerprint(walls))
+
+def loadOrComputeDistances(layout, directory=None):
+  """
+  Returns the distances for a layout from the cache directory, computing
+  and storing them first if the file is missing, stale or corrupt.
+  """
+  fileName = cacheFileName(layout.walls, directory)
+  distances = readDistanceFile(fileName, layout.walls)
+  if distances is None:
+    distances = computeDistances(layout)
+    try:
+      writeDistanceFile(fileName, layout.walls, distances.matrix)
+    except (IOError, OSError):
+      # A read-only or full cache directory just means recomputing next time
+      return distances
+    distances = readDistanceFile(fileName, layout.walls) or distances
+  return distances
+
+def writeDistanceFile(fileName, walls, matrix):
+  """
+  Writes a distance matrix next to its header.  The file is written under a
+  temporary name and renamed so concurrent readers never see partial data.
+  """
+  payload = matrix.tobytes()
+  numCells = len(walls.asList(False))
+  header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, sys.byteorder[0].encode(),
+                             walls.width, walls.height, numCells,
+                             zlib.crc32(payload), bytes.fromhex(wallFingerprint(walls)))
+  directory = os.path.dirname(fileName)
+  if directory and not os.path.isdir(directory):
+    os.makedirs(directory)
+  tempName = '%s.%d.tmp' % (fileName, os.getpid())
+  with open(tempName, 'wb') as f:
+    f.write(header)
+    f.write(payload)
+    f.flush()
+    _verifiedFiles[fileName] = fileIdentity(os.fstat(f.fileno()), zlib.crc32(payload))
+  os.replace(tempName, fileName)
+
+# File name -> identity of the distance file last verified (or written) by
+# this process, whose payload checksum need not be recomputed
+_verifiedFiles = {}
+
+def fileIdentity(status, checksum):
+  "What tells a verified distance file from a later rewrite of it"
+  return (status.st_ino, status.st_size, status.st_mtime_ns, checksum)
+
+def readDistanceFile(fileName, walls):
+  """
+  Maps a cached distance file read-only and returns a DistanceTable whose
+  matrix is an int16 memoryview over the shared pages.  Returns None if the file
+  does not exist or does not match the walls.  The payload checksum is only
+  computed the first time this process sees a given version of the file.
+  """
+  try:
+    with open(fileName, 'rb') as f:
+      status = os.fstat(f.fileno())
+      mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except (IOError, OSError, ValueError):
+    return None
+  payload = table = None
+  try:
+    if len(mapped) < CACHE_HEADER.size:
+      return None
+    magic, version, byteOrder, width, height, numCells, checksum, digest = CACHE_HEADER.unpack_from(mapped)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION or byteOrder != sys.byteorder[0].encode():
+      return None
+    if (width, height) != (walls.width, walls.height) or digest.hex() != wallFingerprint(walls):
+      return None
+    cellIndex = buildCellGraph(walls)[0]
+    payload = memoryview(mapped)[CACHE_HEADER.size:]
+    if numCells != len(cellIndex) or len(payload) != 2 * numCells * numCells:
+      return None
+    identity = fileIdentity(status, checksum)
+    if _verifiedFiles.get(fileName) != identity:
+      if zlib.crc32(payload) != checksum:
+        return None
+      _verifiedFiles[fileName] = identity
+    table = DistanceTable(cellIndex, payload.cast('h'))
+    return table
+  finally:
+    # Unmap the file unless the returned table keeps it
+    if table is None:
+      if payload is not None:
+        payload.release()
+      mapped.close()
+
+def getDistanceOnGrid(distances, pos1, pos2):
+    distance = lookupDistance(distances, pos1, pos2)
+    if distance is None:
+      return 100000
+    return distance
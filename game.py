@@ -74,11 +74,24 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are immutable.  Those reached through generateSuccessor
+    are interned, so every state in a search tree shares one object per
+    (position, direction) and the hash is computed once.
     """
+    __slots__ = ('pos', 'direction', '_hash', '_successors')
 
     def __init__(self, pos, direction):
-        self.pos = pos
-        self.direction = direction
+        object.__setattr__(self, 'pos', pos)
+        object.__setattr__(self, 'direction', direction)
+        object.__setattr__(self, '_hash', hash(hash(pos) + 13 * hash(direction)))
+        object.__setattr__(self, '_successors', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configuration is immutable; create a new one instead')
+
+    def __reduce__(self):
+        return (Configuration, (self.pos, self.direction))
 
     def getPosition(self):
         return (self.pos)
@@ -91,13 +104,12 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None: return False
+        if self is other: return True
+        if other is None: return False
         return (self.pos == other.pos and self.direction == other.direction)
 
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        return self._hash
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -110,17 +122,39 @@ class Configuration:
 
         Actions are movement vectors.
         """
+        successors = self._successors
+        if successors is None:
+            successors = {}
+            object.__setattr__(self, '_successors', successors)
+        elif vector in successors:
+            return successors[vector]
         x, y= self.pos
         dx, dy = vector
         direction = Actions.vectorToDirection(vector)
         if direction == Directions.STOP:
             direction = self.direction # There is no stop direction
-        return Configuration((x + dx, y+dy), direction)
+        successor = internConfiguration((x + dx, y+dy), direction)
+        successors[vector] = successor
+        return successor
+
+_internedConfigurations = {}
+
+def internConfiguration(pos, direction):
+    """
+    Returns the shared Configuration for pos and direction.  The key includes
+    the coordinate types so that (1, 2) and (1.0, 2.0) stay distinct.
+    """
+    key = (pos, direction, type(pos[0]), type(pos[1]))
+    configuration = _internedConfigurations.get(key)
+    if configuration is None:
+        configuration = _internedConfigurations[key] = Configuration(pos, direction)
+    return configuration
 
 class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
     """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying', 'numReturned')
 
     def __init__( self, startConfiguration, isPacman ):
         self.start = startConfiguration
@@ -137,7 +171,7 @@ class AgentState:
             return "Ghost: " + str( self.configuration )
 
     def __eq__( self, other ):
-        if other == None:
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
@@ -145,15 +179,17 @@ class AgentState:
         return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
+        state = AgentState.__new__( AgentState )
+        state.start = self.start
         state.configuration = self.configuration
+        state.isPacman = self.isPacman
         state.scaredTimer = self.scaredTimer
         state.numCarrying = self.numCarrying
         state.numReturned = self.numReturned
         return state
 
     def getPosition(self):
-        if self.configuration == None: return None
+        if self.configuration is None: return None
         return self.configuration.getPosition()
 
     def getDirection(self):
@@ -190,22 +226,25 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        if self.data == other.data: return True
+        # A frozen grid keeps its columns in tuples, which never equal lists
+        if not isinstance(self.data, tuple) and not isinstance(other.data, tuple): return False
+        return [list(column) for column in self.data] == [list(column) for column in other.data]
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash(self.toBits())
+
+    def __reduce__(self):
+        # Boolean grids pickle (for records and process pools) in the compact binary format
+        for column in self.data:
+            for cell in column:
+                if cell is not True and cell is not False:
+                    return object.__reduce_ex__(self, 2)
+        return (_unpickleGrid, (gridToBytes(self), False))
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.data = [list(x) for x in self.data]
         return g
 
     def deepCopy(self):
@@ -216,9 +255,27 @@ class Grid:
         g.data = self.data
         return g
 
+    def freeze(self):
+        """
+        Makes the grid read-only: its columns become tuples, so assigning
+        to grid[x][y] raises TypeError.  Copies are writable again.
+        """
+        self.data = tuple(tuple(column) for column in self.data)
+
+    def isFrozen(self):
+        return isinstance(self.data, tuple)
+
     def count(self, item =True ):
         return sum([x.count(item) for x in self.data])
 
+    def fingerprint(self):
+        """
+        Returns a hex digest of the grid's size and contents that, unlike
+        hash(grid), is stable across processes.
+        """
+        import hashlib
+        return hashlib.sha1(gridToBytes(self)).hexdigest()
+
     def asList(self, key = True):
         list = []
         for x in range(self.width):
@@ -226,27 +283,27 @@ class Grid:
                 if self[x][y] == key: list.append( (x,y) )
         return list
 
+    def toBits(self):
+        "Returns the cells as one int, with cell (x,y) at bit x * height + y"
+        digits = ['1' if cell else '0' for column in reversed(self.data) for cell in reversed(column)]
+        return int(''.join(digits) or '0', 2)
+
+    def _setBits(self, bits):
+        numCells = self.width * self.height
+        digits = format(bits, '0%db' % numCells)[::-1] if numCells else ''
+        h = self.height
+        self.data = [[digit == '1' for digit in digits[x * h:(x + 1) * h]] for x in range(self.width)]
+
     def packBits(self):
         """
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
         """
-        bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
-        return tuple(bits)
+        return _packBitInts(self.width, self.height, self.toBits(), self.CELLS_PER_INT)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -254,25 +311,230 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
+        self._setBits(_unpackBitInts(self.width, self.height, bits, self.CELLS_PER_INT))
+
+def _popcount(n):
+    return bin(n).count('1')
+
+if hasattr(int, 'bit_count'):
+    _popcount = int.bit_count
+
+class BitGrid:
+    """
+    A Grid backed by the bits of a single Python int: cell (x,y) is bit
+    x * height + y, the numbering Grid.__hash__ already uses, so both
+    backends hash equal boards to the same value.  Data is still accessed
+    via grid[x][y] through a lightweight column proxy, while count, asList,
+    copy, __eq__ and __hash__ work on the whole int at once.
+    """
+    def __init__(self, width, height, initialValue=False, bits=0):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.width = width
+        self.height = height
+        if initialValue:
+            bits = (1 << (width * height)) - 1
+        self.bits = bits
+
+    def fromGrid(grid):
+        "Converts a list-backed Grid (or any grid[x][y] board) to a BitGrid"
+        if hasattr(grid, 'toBits'):
+            return BitGrid(grid.width, grid.height, bits=grid.toBits())
+        bits = 0
+        bit = 1
+        for x in range(grid.width):
+            column = grid[x]
+            for y in range(grid.height):
+                if column[y]:
+                    bits |= bit
+                bit <<= 1
+        return BitGrid(grid.width, grid.height, bits=bits)
+    fromGrid = staticmethod(fromGrid)
+
+    def toGrid(self):
+        g = Grid(self.width, self.height)
+        g._setBits(self.bits)
+        return g
+
+    def toBits(self):
+        return self.bits
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += self.width
+        if not 0 <= x < self.width:
+            raise IndexError('column %d out of range' % x)
+        return _BitColumn(self, x)
+
+    def __setitem__(self, x, column):
+        for y, value in enumerate(column):
+            self._set(x, y, value)
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield _BitColumn(self, x)
+
+    def _set(self, x, y, value):
+        bit = 1 << (x * self.height + y)
+        if value:
+            self.bits |= bit
+        else:
+            self.bits &= ~bit
+
+    def getData(self):
+        "The board as a list of columns, like Grid.data (a snapshot, not a view)"
+        return self.toGrid().data
+    data = property(getData)
+
+    def __str__(self):
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def __eq__(self, other):
+        if other == None: return False
+        if isinstance(other, BitGrid):
+            return self.bits == other.bits and self.width == other.width and self.height == other.height
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self.bits)
 
-    def _unpackInt(self, packed, size):
-        bools = []
+    def __reduce__(self):
+        return (_unpickleGrid, (gridToBytes(self), True))
+
+    def copy(self):
+        return BitGrid(self.width, self.height, bits=self.bits)
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        # ints are immutable, so a copy is as cheap as sharing
+        return self.copy()
+
+    def count(self, item =True ):
+        if item == True:
+            return _popcount(self.bits)
+        if item == False:
+            return self.width * self.height - _popcount(self.bits)
+        return 0
+
+    def asList(self, key = True):
+        bits = self.bits
+        if not key:
+            bits = ~bits & ((1 << (self.width * self.height)) - 1)
+        height = self.height
+        positions = []
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            positions.append((index // height, index % height))
+            bits ^= low
+        return positions
+
+    def fingerprint(self):
+        import hashlib
+        return hashlib.sha1(gridToBytes(self)).hexdigest()
+
+    def packBits(self):
+        return _packBitInts(self.width, self.height, self.bits, 30)
+
+class _BitColumn:
+    "One column of a BitGrid, so grid[x][y] reads and writes work as with Grid"
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        grid = self.grid
+        if y < 0:
+            y += grid.height
+        if not 0 <= y < grid.height:
+            raise IndexError('row %d out of range' % y)
+        return (grid.bits >> (self.x * grid.height + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        grid = self.grid
+        if y < 0:
+            y += grid.height
+        if not 0 <= y < grid.height:
+            raise IndexError('row %d out of range' % y)
+        grid._set(self.x, y, value)
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        bits = self.grid.bits >> (self.x * self.grid.height)
+        for y in range(self.grid.height):
+            yield (bits >> y) & 1 == 1
+
+def _packBitInts(width, height, bits, cellsPerInt):
+    """
+    Splits a grid's bits into the packBits tuple: chunks of cellsPerInt
+    cells, the first cell of each chunk in its most significant bit.
+    """
+    packed = [width, height]
+    mask = (1 << cellsPerInt) - 1
+    chunkFormat = '0%db' % cellsPerInt
+    for start in range(0, width * height + 1, cellsPerInt):
+        packed.append(int(format((bits >> start) & mask, chunkFormat)[::-1], 2))
+    return tuple(packed)
+
+def _unpackBitInts(width, height, packedInts, cellsPerInt):
+    "Inverse of _packBitInts (without the leading width and height)"
+    bits = 0
+    chunkFormat = '0%db' % cellsPerInt
+    for i, packed in enumerate(packedInts):
         if packed < 0: raise ValueError("must be a positive integer")
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        if packed >> cellsPerInt: raise ValueError("packed int has more than %d cells" % cellsPerInt)
+        bits |= int(format(packed, chunkFormat)[::-1], 2) << (i * cellsPerInt)
+    return bits & ((1 << (width * height)) - 1)
+
+# Binary grid codec: a versioned header followed by the cell bits as a
+# little-endian integer (cell (x,y) at bit x * height + y).  Record files,
+# pickles sent between processes and disk caches all use this format.
+import struct as _struct
+GRID_MAGIC = b'GR'
+GRID_CODEC_VERSION = 1
+GRID_HEADER = _struct.Struct('<2sBHH')
+
+def gridToBytes(grid):
+    "Encodes a boolean Grid or BitGrid as bytes"
+    numBytes = (grid.width * grid.height + 7) // 8
+    header = GRID_HEADER.pack(GRID_MAGIC, GRID_CODEC_VERSION, grid.width, grid.height)
+    return header + grid.toBits().to_bytes(numBytes, 'little')
+
+def gridFromBytes(data, offset=0, bitGrid=True):
+    """
+    Decodes a grid written by gridToBytes starting at offset in data (any
+    bytes-like object).  Returns (grid, end) where end is the offset just
+    past the encoded grid.  The grid is a BitGrid unless bitGrid is False.
+    """
+    if len(data) - offset < GRID_HEADER.size:
+        raise ValueError('truncated grid header')
+    magic, version, width, height = GRID_HEADER.unpack_from(data, offset)
+    if magic != GRID_MAGIC:
+        raise ValueError('not an encoded grid')
+    if version != GRID_CODEC_VERSION:
+        raise ValueError('unsupported grid codec version %d' % version)
+    start = offset + GRID_HEADER.size
+    end = start + (width * height + 7) // 8
+    if len(data) < end:
+        raise ValueError('truncated grid data')
+    bits = int.from_bytes(data[start:end], 'little')
+    if bits >> (width * height):
+        raise ValueError('grid data has bits outside the board')
+    if bitGrid:
+        return BitGrid(width, height, bits=bits), end
+    grid = Grid(width, height)
+    grid._setBits(bits)
+    return grid, end
+
+def _unpickleGrid(data, bitGrid):
+    return gridFromBytes(data, 0, bitGrid)[0]
 
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
@@ -368,26 +630,122 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+_legalActionTables = {}
+
+def legalActionTable(walls, fingerprint=None):
+    """
+    Maps every open cell of walls to the tuple of directions that
+    Actions.getPossibleActions allows there, in the same order.  Tables are
+    shared between all grids with the same wall fingerprint.
+    """
+    if fingerprint is None:
+        fingerprint = walls.fingerprint()
+    table = _legalActionTables.get(fingerprint)
+    if table is None:
+        table = {}
+        for x, y in walls.asList(False):
+            table[(x, y)] = tuple(direction for direction, (dx, dy) in Actions._directionsAsList
+                                  if not walls[x + dx][y + dy])
+        _legalActionTables[fingerprint] = table
+    return table
+
+import random as _random
+
+# Zobrist keys: one random 64-bit number per state feature, drawn the first
+# time the feature is seen.  A state's key is the xor of its features' keys,
+# so a move updates it by xoring out what changed and xoring in the result.
+_zobristRandom = _random.Random(0x5a0b)
+_zobristAgentKeys = {}
+_zobristTimerKeys = {}
+_zobristFoodKeys = {}
+_zobristCapsuleKeys = {}
+_zobristScoreKeys = {}
+
+def _zobristKey(table, feature):
+    key = table.get(feature)
+    if key is None:
+        key = table[feature] = _zobristRandom.getrandbits(64)
+    return key
+
+def zobristAgentKey(index, agentState):
+    "The key for agent index being in agentState (configuration and scared timer)"
+    return (_zobristKey(_zobristAgentKeys, (index, agentState.configuration)) ^
+            _zobristKey(_zobristTimerKeys, (index, agentState.scaredTimer)))
+
 class GameStateData:
     """
 
     """
-    def __init__( self, prevState = None ):
+    _zobrist = None
+    # Bit per agent index whose term has been taken out of _zobrist because
+    # the agent state was handed out for writing outside the rules; the
+    # terms go back in, from the then current values, when the key is read.
+    # _inMove is set while the rules play a move, which keep the key up to
+    # date themselves.
+    _staleAgents = 0
+    _inMove = False
+    # Undo records of GameState.apply, one list reused by every apply on
+    # this state.  While a move is being applied _journalMark is the index
+    # of its first agent record and _touched has a bit set per agent index
+    # already recorded.
+    _journal = None
+    _journalMark = None
+    _touched = 0
+    # Running (red, blue) totals of the food agents carry and have returned
+    carriedFood = (0, 0)
+    returnedFood = (0, 0)
+
+    def __init__( self, prevState = None, copyOnWrite = False ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        With copyOnWrite the agent states, food and capsules are shared with
+        prevState and only cloned when fetched through the getMutable*
+        accessors, so a successor pays only for what its action changes.
+        Sharing is marked on both sides: prevState also clones before it
+        next hands out one of its agent states for writing.  Such a copy is
+        a view of prevState, so it also keeps the bookkeeping of the last
+        move (_agentMoved, _foodEaten, ...); rules playing a move on it
+        reset that first.
         """
+        self._sharedAgents = set()
+        self._sharedFood = False
+        self._sharedCapsules = False
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            if copyOnWrite:
+                self.food = prevState.food
+                self.capsules = prevState.capsules
+                self.agentStates = prevState.agentStates[:]
+                self._sharedAgents = set( range( len( self.agentStates ) ) )
+                self._sharedCapsules = True
+                if len( prevState._sharedAgents ) < len( self.agentStates ):
+                    prevState._sharedAgents = set( self._sharedAgents )
+                prevState._sharedFood = True
+                prevState._sharedCapsules = True
+            else:
+                self.food = prevState.food.shallowCopy()
+                self.capsules = prevState.capsules[:]
+                self.agentStates = self.copyAgentStates( prevState.agentStates )
+            # A shallow copy of a Grid still shares its columns
+            self._sharedFood = True
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
-
-        self._foodEaten = None
-        self._foodAdded = None
-        self._capsuleEaten = None
-        self._agentMoved = None
+            self.carriedFood = prevState.carriedFood
+            self.returnedFood = prevState.returnedFood
+            self._zobrist = prevState._zobrist
+            self._staleAgents = prevState._staleAgents
+
+        if prevState != None and copyOnWrite:
+            self._foodEaten = prevState._foodEaten
+            self._foodAdded = prevState._foodAdded
+            self._capsuleEaten = prevState._capsuleEaten
+            self._agentMoved = prevState._agentMoved
+        else:
+            self._foodEaten = None
+            self._foodAdded = None
+            self._capsuleEaten = None
+            self._agentMoved = None
         self._lose = False
         self._win = False
         self.scoreChange = 0
@@ -395,7 +753,8 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state._sharedFood = False
+        state.layout = self.layout
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
@@ -408,12 +767,150 @@ class GameStateData:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def getMutableAgentState( self, index ):
+        """
+        Returns the agent state at index, first cloning it if it is still
+        shared with the state this one was copied from.  While GameState.apply
+        plays a move, the first access also journals the agent's field
+        values, as the move then changes it in place; the clone of a shared
+        agent state is kept by undo, so later moves need not clone again.
+        Outside a move the agent is marked stale in the Zobrist key, which
+        is brought up to date when next read.
+        """
+        if index in self._sharedAgents:
+            self._sharedAgents.discard( index )
+            self.agentStates[index] = self.agentStates[index].copy()
+        agentState = self.agentStates[index]
+        if self._journalMark is not None and not self._touched >> index & 1:
+            self._touched |= 1 << index
+            self._journal.append( ( index, agentState.configuration, agentState.isPacman, agentState.scaredTimer,
+                                    agentState.numCarrying, agentState.numReturned ) )
+        if not self._inMove and self._zobrist is not None and not self._staleAgents >> index & 1:
+            self._zobrist ^= zobristAgentKey( index, agentState )
+            self._staleAgents |= 1 << index
+        return agentState
+
+    def setAgentConfiguration( self, index, configuration ):
+        """
+        Moves agent index to configuration (None hides it).
+        """
+        self.getMutableAgentState( index ).configuration = configuration
+
+    def getMutableFood( self ):
+        """
+        Returns the food grid, first copying it if it is shared.  Outside a
+        move this drops the Zobrist key, to be recomputed when next read.
+        """
+        if self._sharedFood:
+            self.food = self.food.copy()
+            self._sharedFood = False
+        if not self._inMove:
+            self._zobrist = None
+            self._staleAgents = 0
+        return self.food
+
+    def getMutableCapsules( self ):
+        """
+        Returns the capsule list, first copying it if it is shared.  Outside
+        a move this drops the Zobrist key, to be recomputed when next read.
+        """
+        if self._sharedCapsules:
+            self.capsules = self.capsules[:]
+            self._sharedCapsules = False
+        if not self._inMove:
+            self._zobrist = None
+            self._staleAgents = 0
+        return self.capsules
+
+    def computeZobristKey( self ):
+        "The Zobrist key of this state, computed from scratch"
+        key = _zobristKey( _zobristScoreKeys, self.score )
+        for index, agentState in enumerate( self.agentStates ):
+            key ^= zobristAgentKey( index, agentState )
+        for position in self.food.asList():
+            key ^= _zobristKey( _zobristFoodKeys, position )
+        for position in self.capsules:
+            key ^= _zobristKey( _zobristCapsuleKeys, position )
+        return key
+
+    def getZobristKey( self ):
+        """
+        The Zobrist key of this state, first putting back the terms of agents
+        handed out for writing (or computing it, if it was dropped).
+        """
+        if self._zobrist is None:
+            self._zobrist = self.computeZobristKey()
+        elif self._staleAgents:
+            key = self._zobrist
+            for index, agentState in enumerate( self.agentStates ):
+                if self._staleAgents >> index & 1:
+                    key ^= zobristAgentKey( index, agentState )
+            self._zobrist = key
+        self._staleAgents = 0
+        return self._zobrist
+
+    def rehash( self ):
+        """
+        Recomputes the Zobrist key.  The getMutable* accessors keep track of
+        edits made through the objects they return until the key is next
+        read; call this after any other direct edit, such as to the score or
+        to an agent state fetched before the key was last read.
+        """
+        self._zobrist = self.computeZobristKey()
+        self._staleAgents = 0
+
+    def updateZobristKey( self, prevAgentStates, prevScore ):
+        """
+        Brings the key inherited from the previous state up to date after the
+        rules have played one move.  Agent states are compared by identity,
+        so the rules must replace (or copy) any agent state they change; with
+        prevAgentStates None (GameState.apply) the agents journaled for the
+        move are used instead.  Food and capsule changes are read from
+        _foodEaten, _foodAdded and _capsuleEaten, each of which marks a cell
+        that flipped.
+        """
+        key = self._zobrist
+        if key is None: return
+        if self._staleAgents:
+            # Out of date before the move: leave it to be recomputed
+            self._zobrist = None
+            self._staleAgents = 0
+            return
+        agentStates = self.agentStates
+        if prevAgentStates is None:
+            journal = self._journal
+            for position in range( self._journalMark, len( journal ) ):
+                index, configuration, isPacman, scaredTimer = journal[position][:4]
+                agentState = agentStates[index]
+                if configuration is not agentState.configuration:
+                    key ^= ( _zobristKey( _zobristAgentKeys, ( index, configuration ) ) ^
+                             _zobristKey( _zobristAgentKeys, ( index, agentState.configuration ) ) )
+                if scaredTimer != agentState.scaredTimer:
+                    key ^= ( _zobristKey( _zobristTimerKeys, ( index, scaredTimer ) ) ^
+                             _zobristKey( _zobristTimerKeys, ( index, agentState.scaredTimer ) ) )
+        else:
+            for index, agentState in enumerate( agentStates ):
+                prevAgentState = prevAgentStates[index]
+                if agentState is not prevAgentState:
+                    key ^= zobristAgentKey( index, prevAgentState ) ^ zobristAgentKey( index, agentState )
+        if self._foodEaten != None:
+            key ^= _zobristKey( _zobristFoodKeys, self._foodEaten )
+        if self._foodAdded:
+            for position in self._foodAdded:
+                key ^= _zobristKey( _zobristFoodKeys, position )
+        if self._capsuleEaten != None:
+            key ^= _zobristKey( _zobristCapsuleKeys, self._capsuleEaten )
+        if self.score != prevScore:
+            key ^= _zobristKey( _zobristScoreKeys, prevScore ) ^ _zobristKey( _zobristScoreKeys, self.score )
+        self._zobrist = key
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
         """
-        if other == None: return False
+        if other is None: return False
         # TODO Check for type of other
+        if self.getZobristKey() != other.getZobristKey(): return False
         if not self.agentStates == other.agentStates: return False
         if not self.food == other.food: return False
         if not self.capsules == other.capsules: return False
@@ -424,13 +921,7 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        return self.getZobristKey()
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -494,6 +985,8 @@ class GameStateData:
         self.layout = layout
         self.score = 0
         self.scoreChange = 0
+        self.carriedFood = (0, 0)
+        self.returnedFood = (0, 0)
 
         self.agentStates = []
         numGhosts = 0
@@ -503,6 +996,10 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._sharedAgents = set()
+        self._sharedFood = False
+        self._sharedCapsules = False
+        self.rehash()
 
 try:
     import boinc
@@ -616,7 +1113,8 @@ class Game:
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
-            # Generate an observation of the state
+            # Generate an observation of the state.  observationFunction gets
+            # a copy-on-write view, which copies only what it writes to
             if 'observationFunction' in dir( agent ):
                 self.mute(agentIndex)
                 if self.catchExceptions:
@@ -624,7 +1122,7 @@ class Game:
                         timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(self.state.__class__(self.state, copyOnWrite = True))
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -634,7 +1132,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self.state.__class__(self.state, copyOnWrite = True))
                 self.unmute()
             else:
                 observation = self.state.deepCopy()
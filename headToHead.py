@@ -0,0 +1,148 @@
+# headToHead.py
+# -------------
+# Early-stopping comparisons between two capture teams.
+
+"""
+Plays two teams against each other in waves of parallel games, alternating
+colors, until a sequential probability ratio test is confident which team
+is stronger (or the game budget runs out).  Ties count as half a win.
+
+The test weighs H1, "the first team wins with probability 0.5 + margin",
+against H0, "it wins with probability 0.5 - margin", and stops as soon as
+the log likelihood ratio crosses either bound set by --alpha and --beta.
+Evenly matched teams end inconclusive at --maxGames.
+
+USAGE:      python headToHead.py <team> <team> [options]
+EXAMPLES:   python headToHead.py myTeam baselineTeam
+            python headToHead.py myTeam oldTeam -l defaultCapture,RANDOM7 --margin 0.05 --workers 8
+"""
+
+import math, random
+
+import capture
+import layout
+from tournament import layoutText
+
+def sprtBounds(alpha, beta):
+  "The (lower, upper) log likelihood ratio bounds of the test"
+  return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+def logLikelihoodRatio(wins, ties, losses, margin):
+  "log P(results | p = 0.5 + margin) / P(results | p = 0.5 - margin)"
+  p1, p0 = 0.5 + margin, 0.5 - margin
+  points, lost = wins + 0.5 * ties, losses + 0.5 * ties
+  return points * math.log(p1 / p0) + lost * math.log((1 - p1) / (1 - p0))
+
+def winRateInterval(wins, ties, losses, confidence):
+  "Wilson score interval for the win rate, ties counting half"
+  from statistics import NormalDist
+  n = wins + ties + losses
+  if n == 0: return 0.0, 1.0
+  z = NormalDist().inv_cdf(0.5 + confidence / 2)
+  p = (wins + 0.5 * ties) / n
+  center = (p + z * z / (2 * n)) / (1 + z * z / n)
+  spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+  return max(0.0, center - spread), min(1.0, center + spread)
+
+def playWave(pool, first, second, layouts, layoutNames, length, catchExceptions):
+  """
+  Plays the first team as red on every layout and then as blue on every
+  layout on the process pool, and returns the result records of the
+  games in that order, tagged with capture.gameIdentity.  Every game takes
+  a seed from this process's random stream, as capture.runGames does.
+  """
+  tasks = []
+  for teams in [((first, {}), (second, {})), ((second, {}), (first, {}))]:
+    for i, l in enumerate(layouts):
+      tasks.append({'index': len(tasks), 'seed': random.randint(0, 2**31 - 1), 'layoutText': l.layoutText,
+                    'teams': teams, 'length': length, 'muteAgents': True,
+                    'catchExceptions': catchExceptions, 'record': False})
+  return [capture.gameIdentity(result, tasks[result['index']]['teams'], layouts[result['index'] % len(layouts)],
+                               layoutNames[result['index'] % len(layouts)])
+          for result in pool.imap(capture.playGameRecord, tasks)]
+
+def headToHead(first, second, layoutNames, maxGames = 400, wave = 8, margin = 0.1, alpha = 0.05, beta = 0.05,
+               workers = 1, length = 1200, catchExceptions = True, ratingsPath = None):
+  """
+  Runs the test and returns a dict with the games played, wins, ties,
+  losses, the final log likelihood ratio and its bounds, the win rate
+  interval at confidence 1 - alpha and the decision: first, second or
+  inconclusive (the stronger team, if the test settled it).  With
+  ratingsPath, every game is also added to that ratings.py database.
+  One pool of workers processes (at least one) plays every wave.
+  """
+  import multiprocessing
+  lower, upper = sprtBounds(alpha, beta)
+  texts = [layoutText(name) for name in layoutNames]
+  wins = ties = losses = 0
+  llr, decision = 0.0, 'inconclusive'
+  with multiprocessing.Pool(max(1, workers)) as pool:
+    while wins + ties + losses < maxGames:
+      perColor = max(1, min(wave, maxGames - wins - ties - losses) // 2)
+      picks = [(wins + ties + losses + i) % len(texts) for i in range(perColor)]
+      names = [layoutNames[pick] for pick in picks]
+      layouts = [layout.internLayout(texts[pick]) for pick in picks]
+      results = playWave(pool, first, second, layouts, names, length, catchExceptions)
+      if ratingsPath: capture.rateGames(ratingsPath, results)
+      for result in results:
+        score = result['score'] if result['red'] == first else -result['score']
+        if score > 0: wins += 1
+        elif score < 0: losses += 1
+        else: ties += 1
+      llr = logLikelihoodRatio(wins, ties, losses, margin)
+      print('%4d games: %d-%d-%d  LLR %+.2f  (%.2f, %.2f)' % (wins + ties + losses, wins, ties, losses, llr,
+                                                            lower, upper))
+      if llr >= upper:
+        decision = first
+        break
+      if llr <= lower:
+        decision = second
+        break
+  return {'games': wins + ties + losses, 'wins': wins, 'ties': ties, 'losses': losses, 'llr': llr,
+          'bounds': (lower, upper), 'interval': winRateInterval(wins, ties, losses, 1 - alpha), 'decision': decision}
+
+def readCommand(argv):
+  from optparse import OptionParser
+  import os
+  parser = OptionParser(__doc__)
+  parser.add_option('-l', '--layouts', default='defaultCapture',
+                    help=capture.default('Comma separated layouts played in turn; RANDOM<seed> for generated mazes'))
+  parser.add_option('-n', '--maxGames', type='int', default=400,
+                    help=capture.default('Give up, inconclusive, after this many games'))
+  parser.add_option('--wave', type='int', default=None,
+                    help='Games played between checks, half on each color [Default: twice the workers, at least 4]')
+  parser.add_option('--margin', type='float', default=0.1,
+                    help=capture.default('Win rate margin over 0.5 the test distinguishes'))
+  parser.add_option('--alpha', type='float', default=0.05,
+                    help=capture.default('Chance of calling the first team stronger when the second is'))
+  parser.add_option('--beta', type='float', default=0.05,
+                    help=capture.default('Chance of calling the second team stronger when the first is'))
+  parser.add_option('-i', '--time', type='int', default=1200,
+                    help=capture.default('TIME limit of a game in moves'), metavar='TIME')
+  parser.add_option('--workers', type='int', default=os.cpu_count() or 1,
+                    help=capture.default('Worker processes'))
+  parser.add_option('--ratings', default=None, metavar='DB',
+                    help='Also add every game to this ratings.py database')
+  parser.add_option('-f', '--fixRandomSeed', action='store_true', default=False,
+                    help='Fixes the random seed to always play the same games')
+  parser.add_option('--unsafe', dest='catchExceptions', action='store_false', default=True,
+                    help='Let agent exceptions stop the run instead of forfeiting the game, and lift time limits')
+  options, args = parser.parse_args(argv)
+  if len(args) != 2: parser.error('give the two teams to compare')
+  if not (0 < options.margin < 0.5): parser.error('--margin must be between 0 and 0.5')
+  if options.workers < 1: parser.error('--workers must be at least 1')
+  if options.wave is None: options.wave = max(4, 2 * options.workers)
+  options.layouts = [l for l in options.layouts.split(',') if l]
+  return options, args
+
+if __name__ == '__main__':
+  import sys
+  options, (first, second) = readCommand(sys.argv[1:])
+  if options.fixRandomSeed: random.seed('cs188')
+  result = headToHead(first, second, options.layouts, options.maxGames, options.wave, options.margin,
+                      options.alpha, options.beta, options.workers, options.time, options.catchExceptions,
+                      options.ratings)
+  print('Games played: %d (%d wins, %d ties, %d losses for %s)' % (result['games'], result['wins'], result['ties'],
+                                                               result['losses'], first))
+  print('Win rate:     %.1f%% confidence interval [%.3f, %.3f]' % ((100 * (1 - options.alpha),) + result['interval']))
+  print('Decision:     %s' % (result['decision'] == 'inconclusive' and 'inconclusive' or result['decision'] + ' is stronger'))
@@ -0,0 +1,223 @@
+# inference.py
+# ------------
+# Belief tracking of enemy positions for capture agents.
+
+"""
+Array-backed tracking of where unseen opponents might be.
+
+Each opponent's belief is a BeliefGrid: one probability per open cell,
+kept in an array and updated with whole-array passes instead of per-cell
+util.Counter loops.  The per-maze tables the updates need (open cells,
+Manhattan distance rows and legal-move adjacency) live in a BeliefModel
+shared by every layout with the same walls.
+
+Example, inside a CaptureAgent:
+
+  def registerInitialState(self, gameState):
+    CaptureAgent.registerInitialState(self, gameState)
+    self.beliefs = inference.EnemyBeliefs(gameState, self.index)
+
+  def chooseAction(self, gameState):
+    self.beliefs.update(gameState)
+    self.displayDistributionsOverPositions(self.beliefs.getDistributions())
+"""
+
+from array import array
+from game import Actions, legalActionTable
+import util
+
+_models = {}
+
+def getBeliefModel(layout):
+  "Returns the BeliefModel shared by every layout with these walls"
+  fingerprint = layout.getWallFingerprint()
+  model = _models.get(fingerprint)
+  if model is None:
+    model = _models[fingerprint] = BeliefModel(layout.walls, fingerprint)
+  return model
+
+class BeliefModel:
+  """
+  The tables belief updates use for one maze: the open cells, Manhattan
+  distance rows from any position (computed on first use), each cell's
+  legal successors and the sonar likelihood of each reading.
+  """
+  def __init__(self, walls, fingerprint = None):
+    self.cells = walls.asList(False)
+    self.cellIndex = dict((cell, i) for i, cell in enumerate(self.cells))
+    self.numCells = len(self.cells)
+    self.maxDistance = walls.width + walls.height
+    # An agent picks uniformly among its legal actions, stopping included
+    table = legalActionTable(walls, fingerprint)
+    self.successors = []
+    for cell in self.cells:
+      self.successors.append(tuple(self.cellIndex[Actions.getSuccessor(cell, action)] for action in table[cell]))
+    self.moveProbabilities = array('d', [1.0 / len(successors) for successors in self.successors])
+    self._distanceRows = {}
+    self._likelihoods = {}
+
+  def distanceRow(self, position):
+    "The Manhattan distance from position to every cell, as an array"
+    row = self._distanceRows.get(position)
+    if row is None:
+      x, y = position
+      row = array('H', [abs(x - cx) + abs(y - cy) for cx, cy in self.cells])
+      self._distanceRows[position] = row
+    return row
+
+  def likelihoods(self, noisyDistance, distanceProb):
+    """
+    P(noisyDistance | true distance d) for every d, as a list indexed by d.
+    distanceProb is GameState.getDistanceProb.
+    """
+    likelihoods = self._likelihoods.get(noisyDistance)
+    if likelihoods is None:
+      likelihoods = [distanceProb(d, noisyDistance) for d in range(self.maxDistance + 1)]
+      self._likelihoods[noisyDistance] = likelihoods
+    return likelihoods
+
+class BeliefGrid:
+  """
+  A probability distribution over the open cells of a maze, stored as an
+  array of floats in BeliefModel.cells order.  grid[(x, y)] reads one cell
+  (0 for walls), so grids can be displayed and queried like util.Counters.
+  """
+  def __init__(self, model, probabilities = None):
+    self.model = model
+    if probabilities is None:
+      probabilities = array('d', bytes(8 * model.numCells))
+    self.probabilities = probabilities
+
+  def __getitem__(self, position):
+    index = self.model.cellIndex.get(position)
+    if index is None: return 0.0
+    return self.probabilities[index]
+
+  def copy(self):
+    return BeliefGrid(self.model, array('d', self.probabilities))
+
+  def items(self):
+    "(position, probability) pairs for the cells with nonzero probability"
+    cells = self.model.cells
+    return [(cells[i], p) for i, p in enumerate(self.probabilities) if p]
+
+  def asCounter(self):
+    counter = util.Counter()
+    for position, p in self.items():
+      counter[position] = p
+    return counter
+
+  def total(self):
+    return sum(self.probabilities)
+
+  def mostLikely(self):
+    "The most probable cell (the first one on ties)"
+    probabilities = self.probabilities
+    return self.model.cells[probabilities.index(max(probabilities))]
+
+  def setUniform(self):
+    self.probabilities = array('d', [1.0 / self.model.numCells]) * self.model.numCells
+
+  def setPosition(self, position):
+    "Puts all of the probability on one cell"
+    self.probabilities = array('d', bytes(8 * self.model.numCells))
+    self.probabilities[self.model.cellIndex[position]] = 1.0
+
+  def normalize(self):
+    """
+    Scales the probabilities to sum to one.  Returns False, leaving the
+    grid unchanged, when every cell has probability zero.
+    """
+    total = sum(self.probabilities)
+    if total <= 0: return False
+    scale = 1.0 / total
+    self.probabilities = array('d', [p * scale for p in self.probabilities])
+    return True
+
+  def observeDistance(self, position, noisyDistance, distanceProb):
+    """
+    Weights every cell by the likelihood of a sonar reading taken from
+    position (unnormalized).  distanceProb is GameState.getDistanceProb.
+    """
+    likelihoods = self.model.likelihoods(noisyDistance, distanceProb)
+    row = self.model.distanceRow(position)
+    self.probabilities = array('d', [p * likelihoods[d] for p, d in zip(self.probabilities, row)])
+
+  def excludeWithin(self, position, radius):
+    "Zeroes the cells within Manhattan radius of position (unnormalized)"
+    row = self.model.distanceRow(position)
+    self.probabilities = array('d', [p if d > radius else 0.0 for p, d in zip(self.probabilities, row)])
+
+  def elapseTime(self):
+    "Moves the probability one step along each cell's legal moves"
+    moved = array('d', bytes(8 * self.model.numCells))
+    successors, moveProbabilities = self.model.successors, self.model.moveProbabilities
+    for i, p in enumerate(self.probabilities):
+      if p:
+        share = p * moveProbabilities[i]
+        for j in successors[i]:
+          moved[j] += share
+    self.probabilities = moved
+
+class EnemyBeliefs:
+  """
+  One BeliefGrid per opponent of agent index, starting on the opponents'
+  start cells.  Call update once per turn with the agent's observation.
+  """
+  def __init__(self, gameState, index, sightRange = 5):
+    "sightRange is how far agents see opponents (capture.SIGHT_RANGE)"
+    self.index = index
+    self.sightRange = sightRange
+    self.model = getBeliefModel(gameState.data.layout)
+    self.distanceProb = gameState.getDistanceProb
+    if gameState.isOnRedTeam(index):
+      self.team, self.opponents = gameState.getRedTeamIndices(), gameState.getBlueTeamIndices()
+    else:
+      self.team, self.opponents = gameState.getBlueTeamIndices(), gameState.getRedTeamIndices()
+    self.beliefs = {}
+    for opponent in self.opponents:
+      self.beliefs[opponent] = BeliefGrid(self.model)
+      self.beliefs[opponent].setPosition(gameState.getInitialAgentPosition(opponent))
+
+  def update(self, gameState):
+    """
+    Advances every opponent's belief by one move and folds in the current
+    observation: its exact position when visible, otherwise its sonar
+    reading and the fact that no teammate can see it.  A belief that the
+    evidence rules out entirely (after a respawn, say) restarts uniform.
+    """
+    position = gameState.getAgentPosition(self.index)
+    distances = gameState.getAgentDistances()
+    teamPositions = [gameState.getAgentPosition(i) for i in self.team]
+    for opponent in self.opponents:
+      belief = self.beliefs[opponent]
+      opponentPosition = gameState.getAgentPosition(opponent)
+      if opponentPosition is not None:
+        belief.setPosition(opponentPosition)
+        continue
+      belief.elapseTime()
+      if not self._observe(belief, position, distances[opponent], teamPositions):
+        belief.setUniform()
+        if not self._observe(belief, position, distances[opponent], teamPositions):
+          belief.setUniform()
+
+  def _observe(self, belief, position, noisyDistance, teamPositions):
+    if noisyDistance is not None:
+      belief.observeDistance(position, noisyDistance, self.distanceProb)
+    for teammatePosition in teamPositions:
+      if teammatePosition is not None:
+        belief.excludeWithin(teammatePosition, self.sightRange)
+    return belief.normalize()
+
+  def getBelief(self, opponent):
+    return self.beliefs[opponent]
+
+  def mostLikelyPosition(self, opponent):
+    return self.beliefs[opponent].mostLikely()
+
+  def getDistributions(self):
+    """
+    A list with each opponent's BeliefGrid at its agent index and None
+    elsewhere, as CaptureAgent.displayDistributionsOverPositions expects.
+    """
+    return [self.beliefs.get(i) for i in range(max(self.team + self.opponents) + 1)]
@@ -14,6 +14,7 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import legalActionTable
 import os
 import random
 from functools import reduce
@@ -23,6 +24,10 @@ VISIBILITY_MATRIX_CACHE = {}
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Layouts do not change once built: the walls are frozen and every game
+    state shares the same instance (see internLayout).  Use clone() for a
+    private copy that may be modified, and refreeze() it once done.
     """
 
     def __init__(self, layoutText):
@@ -36,6 +41,9 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.walls.freeze()
+        self._wallFingerprint = self.walls.fingerprint()
+        self._legalActions = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -90,8 +98,50 @@ class Layout:
     def __str__(self):
         return "\n".join(self.layoutText)
 
+    def getWallFingerprint(self):
+        """
+        A stable digest of the walls, used to share per-maze tables (such as
+        maze distances) between every layout with the same walls.  It is
+        only cached while the walls are frozen; the writable walls of a
+        clone are digested again on every call.
+        """
+        if not self.walls.isFrozen():
+            return self.walls.fingerprint()
+        if self._wallFingerprint is None:
+            self._wallFingerprint = self.walls.fingerprint()
+        return self._wallFingerprint
+
+    def getLegalActionTable(self):
+        """
+        The open cell -> legal directions table for these walls (see
+        game.legalActionTable).
+        """
+        if not self.walls.isFrozen():
+            return legalActionTable(self.walls, self.getWallFingerprint())
+        if self._legalActions is None:
+            self._legalActions = legalActionTable(self.walls, self.getWallFingerprint())
+        return self._legalActions
+
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        "Layouts are immutable, so a deep copy is the layout itself"
+        return self
+
+    def clone(self):
+        """
+        Returns a private copy of the layout whose walls can be modified
+        until refreeze() is called.
+        """
+        layout = Layout(self.layoutText[:])
+        layout.walls = layout.walls.copy()
+        layout._wallFingerprint = None
+        layout._legalActions = None
+        return layout
+
+    def refreeze(self):
+        "Freezes a clone's edited walls, so their tables are cached again"
+        self.walls.freeze()
+        self._wallFingerprint = None
+        self._legalActions = None
 
     def processLayoutText(self, layoutText):
         """
@@ -146,5 +196,18 @@ def getLayout(name, back = 2):
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return internLayout([line.strip() for line in f])
     finally: f.close()
+
+_layouts = {}
+
+def internLayout(layoutText):
+    """
+    Returns the shared Layout for layoutText, parsing it only the first
+    time the text is seen.
+    """
+    key = tuple(layoutText)
+    layout = _layouts.get(key)
+    if layout is None:
+        layout = _layouts[key] = Layout(list(layoutText))
+    return layout
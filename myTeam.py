@@ -165,7 +165,7 @@ class DynamicAgent(CaptureAgent):
   # If time is running out, consider returning home.
     homeBoundary = self.getHomeBoundary(gameState)
     if len(homeBoundary) > 0:
-      homeDistances = [self.getMazeDistance(myPos, h) for h in homeBoundary]
+      homeDistances = self.getMazeDistances(myPos, homeBoundary)
       closestHomeDist = min(homeDistances) if homeDistances else float('inf')
     if timeLeft < closestHomeDist + 4 and self.currentRole != 'Defense':
       self.currentRole = 'ReturnHome'
@@ -214,16 +214,14 @@ class DynamicAgent(CaptureAgent):
         # Divide food among agents
         myFoods = self.getAssignedFoods(successor)
         if len(myFoods) > 0:
-          minDistance = min([self.getMazeDistance(myPos, food) for food in myFoods])
-          features['distanceToFood'] = minDistance
           # Set target to closest food
-          closestFood = min(myFoods, key=lambda food: self.getMazeDistance(myPos, food))
+          closestFood, minDistance = self.getClosestByMazeDistance(myPos, myFoods)
+          features['distanceToFood'] = minDistance
           self.target = closestFood
         else:
           # No assigned foods, just pick the closest food
-          minDistance = min([self.getMazeDistance(myPos, food) for food in foodList])
+          closestFood, minDistance = self.getClosestByMazeDistance(myPos, foodList)
           features['distanceToFood'] = minDistance
-          closestFood = min(foodList, key=lambda food: self.getMazeDistance(myPos, food))
           self.target = closestFood
 
       # Avoid enemies
@@ -311,7 +309,7 @@ class DynamicAgent(CaptureAgent):
     elif self.currentRole == 'ReturnHome':
       # Compute distance to home
       homeBoundary = self.getHomeBoundary(gameState)
-      minDistance = min([self.getMazeDistance(myPos, point) for point in homeBoundary])
+      minDistance = min(self.getMazeDistances(myPos, homeBoundary))
       features['distanceToHome'] = minDistance
 
       # Avoid enemies
@@ -326,7 +324,7 @@ class DynamicAgent(CaptureAgent):
           # Consider power capsules
         capsules = self.getCapsules(successor)
         if len(capsules) > 0:
-          minCapsuleDist = min([self.getMazeDistance(myPos, cap) for cap in capsules])
+          minCapsuleDist = min(self.getMazeDistances(myPos, capsules))
           features['distanceToCapsule'] = minCapsuleDist
 
     # Don't stop or reverse unless necessary
@@ -380,10 +378,13 @@ class DynamicAgent(CaptureAgent):
     myPos = gameState.getAgentState(self.index).getPosition()
     teammatePos = self.lastTeammatePos
     foods = self.getFood(gameState).asList()
+    myDistances = self.getMazeDistances(myPos, foods)
+    if teammatePos:
+      teammateDistances = self.getMazeDistances(teammatePos, foods)
+    else:
+      teammateDistances = [float('inf')] * len(foods)
     myFoods = []
-    for food in foods:
-      myDist = self.getMazeDistance(myPos, food)
-      teammateDist = self.getMazeDistance(teammatePos, food) if teammatePos else float('inf')
+    for food, myDist, teammateDist in zip(foods, myDistances, teammateDistances):
       if myDist < teammateDist:
         myFoods.append(food)
       elif myDist == teammateDist:
@@ -447,9 +448,8 @@ class DynamicAgent(CaptureAgent):
         # pick a max distance threshold. Adjust as desired.
         maxDistanceThreshold = 7
         refinedPoints = []
-        for p in patrolPoints:
+        for p, distances in zip(patrolPoints, self.getMazeDistanceMatrix(patrolPoints, criticalPoints)):
           # If the patrol point is relatively close to any defended resource, keep it
-          distances = [self.getMazeDistance(p, c) for c in criticalPoints]
           if distances and min(distances) <= maxDistanceThreshold:
             refinedPoints.append(p)
         # If filtering removes all points, fallback to original patrolPoints
@@ -510,10 +510,9 @@ class DynamicAgent(CaptureAgent):
 
       # For each capsule, find the minimum distance from any friendly agent
       capsuleDistances = []
-      for c in capsules:
-        distancesToCapsule = [self.getMazeDistance(pos, c) for pos in friendlyPositions if pos is not None]
-        if distancesToCapsule:
-          capsuleDistances.append(min(distancesToCapsule))
+      friendlyPositions = [pos for pos in friendlyPositions if pos is not None]
+      for distancesToCapsule in zip(*self.getMazeDistanceMatrix(friendlyPositions, capsules)):
+        capsuleDistances.append(min(distancesToCapsule))
 
       # Determine the closest capsule distance among all friendly agents
       closestCapsuleDist = min(capsuleDistances) if len(capsuleDistances) > 0 else float('inf')
@@ -526,7 +525,7 @@ class DynamicAgent(CaptureAgent):
     # If capsules won't/can't help, consider if you can return home safely
     homeBoundary = self.getHomeBoundary(gameState)
     if len(homeBoundary) > 0:
-      homeDistances = [self.getMazeDistance(myPos, h) for h in homeBoundary]
+      homeDistances = self.getMazeDistances(myPos, homeBoundary)
       closestHomeDist = min(homeDistances) if homeDistances else float('inf')
 
       if carrying > self.hvtThreshold:
@@ -575,24 +574,16 @@ class DynamicAgent(CaptureAgent):
       # Without enemy info (I think this shouldn't occur through).
       return False
 
-    # Check each food's accessibility
-    for foodPos in defendedFood:
-      # Distance for friendly agents
-      friendlyDistances = [self.getMazeDistance(foodPos, fPos) for fPos in friendlyPositions if fPos is not None]
-      if len(friendlyDistances) == 0:
-        return False  # No friendly agent positions known, can't defend.
-
-      minFriendlyDist = min(friendlyDistances)
-
-      # Distance for enemy agents
-      enemyDistances = [self.getMazeDistance(foodPos, ePos) for ePos in enemyPositions]
-      if len(enemyDistances) == 0:
-        # No known enemy positions, assume enemies might be anywhere
-        # Being conservative, return False
-        return False
+    friendlyPositions = [fPos for fPos in friendlyPositions if fPos is not None]
+    if len(friendlyPositions) == 0:
+      return False  # No friendly agent positions known, can't defend.
 
-      minEnemyDist = min(enemyDistances)
+    # Distances from every agent to every piece of food, one table row per agent
+    friendlyDistanceRows = self.getMazeDistanceMatrix(friendlyPositions, defendedFood)
+    enemyDistanceRows = self.getMazeDistanceMatrix(enemyPositions, defendedFood)
 
+    # Check each food's accessibility
+    for minFriendlyDist, minEnemyDist in zip(map(min, zip(*friendlyDistanceRows)), map(min, zip(*enemyDistanceRows))):
       # If any food that enemies can reach strictly sooner, we can't hold all food reliably
       if minEnemyDist < minFriendlyDist:
         return False
@@ -626,13 +617,15 @@ class DynamicAgent(CaptureAgent):
     else:
       invaderBoundaryX = (layout.width // 2) - 1
 
+    # Open cells at invaders' boundary line, shared by every distance query below
+    boundaryPositions = [(invaderBoundaryX, by) for by in range(layout.height)
+                         if not layout.walls[invaderBoundaryX][by]]
+
     def distanceToInvaderBoundary(pos):
       # Compute min distance to any open cell at invaders' boundary line
-      boundaryPositions = [(invaderBoundaryX, by) for by in range(layout.height)
-                           if not layout.walls[invaderBoundaryX][by]]
       if not boundaryPositions:
         return float('inf')
-      return min(self.getMazeDistance(pos, bpos) for bpos in boundaryPositions)
+      return min(self.getMazeDistances(pos, boundaryPositions))
 
     # Check each friendly agent
     for (allyIndex, allyPos) in friendlyPositions:
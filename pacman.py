@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -120,6 +121,7 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
+        state.data.updateZobristKey( self.data.agentStates, self.data.score )
         GameState.explored.add(self)
         GameState.explored.add(state)
         return state
@@ -217,12 +219,14 @@ class GameState:
     # You shouldn't need to call these directly #
     #############################################
 
-    def __init__( self, prevState = None ):
+    def __init__( self, prevState = None, copyOnWrite = False ):
         """
         Generates a new state by copying information from its predecessor.
+        With copyOnWrite the agent states, food and capsules stay shared with
+        prevState (see GameStateData).
         """
         if prevState != None: # Initial state
-            self.data = GameStateData(prevState.data)
+            self.data = GameStateData(prevState.data, copyOnWrite)
         else:
             self.data = GameStateData()
 
@@ -414,7 +418,7 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            ghostState.configuration = Configuration( nearestPoint( ghostState.configuration.pos ), ghostState.configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
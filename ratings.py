@@ -0,0 +1,199 @@
+# ratings.py
+# ----------
+# Persistent Elo ratings of capture teams, kept in one SQLite file.
+
+"""
+Elo ratings of capture teams over every game ever ingested.  Each team
+version (its module name plus a hash of the module file) has an overall
+rating and one rating per layout; every game updates the four ratings it
+touches in place, so ingesting a game costs the same however long the
+history is.
+
+Results come from tournament.py results files, or are added as games
+finish by the --ratings option of capture.py, tournament.py and
+headToHead.py.  A game is
+identified by its teams, layout and seed, so ingesting it twice has no
+effect; results without a seed cannot be told apart and are skipped.
+
+USAGE:      python ratings.py <command> [args] [--db FILE]
+EXAMPLES:   python ratings.py ingest tournament.jsonl night.jsonl
+            python ratings.py leaderboard
+            python ratings.py weaknesses myTeam
+"""
+
+import hashlib, json, os, sqlite3
+
+DEFAULT_DATABASE = 'ratings.db'
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+
+# Overall ratings are stored under this layout name
+ALL_LAYOUTS = ''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+  id INTEGER PRIMARY KEY,
+  red TEXT NOT NULL, redHash TEXT NOT NULL, blue TEXT NOT NULL, blueHash TEXT NOT NULL,
+  layout TEXT NOT NULL, fingerprint TEXT, seed INTEGER NOT NULL, score INTEGER NOT NULL, winner TEXT NOT NULL,
+  moves INTEGER, redSecondsPerMove REAL, blueSecondsPerMove REAL,
+  UNIQUE (red, redHash, blue, blueHash, layout, seed)
+);
+CREATE TABLE IF NOT EXISTS ratings (
+  team TEXT NOT NULL, version TEXT NOT NULL, layout TEXT NOT NULL,
+  rating REAL NOT NULL, games INTEGER NOT NULL, wins INTEGER NOT NULL, ties INTEGER NOT NULL,
+  losses INTEGER NOT NULL, seconds REAL NOT NULL, moves INTEGER NOT NULL,
+  PRIMARY KEY (team, version, layout)
+);
+"""
+
+def teamHash(team):
+  "A short digest of a team module's source, or '' if the file is missing"
+  fileName = team if team.endswith('.py') else team + '.py'
+  if not os.path.exists(fileName): return ''
+  with open(fileName, 'rb') as f:
+    return hashlib.sha1(f.read()).hexdigest()[:12]
+
+def expectedScore(rating, opponentRating):
+  return 1.0 / (1.0 + 10 ** ((opponentRating - rating) / 400.0))
+
+class RatingStore:
+  """
+  The ratings database.  addResult records one game and updates the
+  ratings; the query methods return rows as dicts.
+  """
+  def __init__(self, path = DEFAULT_DATABASE):
+    self.connection = sqlite3.connect(path)
+    self.connection.row_factory = sqlite3.Row
+    self.connection.executescript(SCHEMA)
+
+  def close(self):
+    self.connection.close()
+
+  def addResult(self, result):
+    """
+    Records a tournament result (red, blue, layout, seed and score,
+    optionally redHash, blueHash, fingerprint, moves, agentTimes and
+    agentMoves) and returns False if the game was already recorded.
+    Missing team hashes are taken from the team files as they are now.
+    """
+    red, blue, layoutName, score = result['red'], result['blue'], result['layout'], result['score']
+    if result.get('seed') is None: raise Exception('A result needs its seed to be rated')
+    redHash = result.get('redHash') or teamHash(red)
+    blueHash = result.get('blueHash') or teamHash(blue)
+    winner = score > 0 and 'red' or score < 0 and 'blue' or 'tie'
+    redSeconds, redMoves, blueSeconds, blueMoves = self._teamTimes(result)
+    with self.connection:
+      cursor = self.connection.execute(
+        'INSERT OR IGNORE INTO games (red, redHash, blue, blueHash, layout, fingerprint, seed, score, winner, moves, '
+        'redSecondsPerMove, blueSecondsPerMove) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        (red, redHash, blue, blueHash, layoutName, result.get('fingerprint'), result['seed'], score, winner,
+         result.get('moves'), redMoves and redSeconds / redMoves, blueMoves and blueSeconds / blueMoves))
+      if cursor.rowcount == 0: return False
+      # A team version playing itself says nothing about its strength
+      if (red, redHash) == (blue, blueHash): return True
+      redScore = {'red': 1.0, 'tie': 0.5, 'blue': 0.0}[winner]
+      for scope in [ALL_LAYOUTS, layoutName]:
+        redRow = self._rating(red, redHash, scope)
+        blueRow = self._rating(blue, blueHash, scope)
+        expected = expectedScore(redRow['rating'], blueRow['rating'])
+        self._update(red, redHash, scope, redRow, K_FACTOR * (redScore - expected), redScore, redSeconds, redMoves)
+        self._update(blue, blueHash, scope, blueRow, K_FACTOR * (expected - redScore), 1 - redScore,
+                     blueSeconds, blueMoves)
+    return True
+
+  def _teamTimes(self, result):
+    "(red seconds, red moves, blue seconds, blue moves) from per-agent timings"
+    times, moves = result.get('agentTimes'), result.get('agentMoves')
+    if not times or not moves: return 0.0, 0, 0.0, 0
+    return times[0] + times[2], moves[0] + moves[2], times[1] + times[3], moves[1] + moves[3]
+
+  def _rating(self, team, version, scope):
+    row = self.connection.execute('SELECT rating FROM ratings WHERE team = ? AND version = ? AND layout = ?',
+                                  (team, version, scope)).fetchone()
+    if row is None: return {'rating': INITIAL_RATING, 'exists': False}
+    return {'rating': row['rating'], 'exists': True}
+
+  def _update(self, team, version, scope, row, change, points, seconds, moves):
+    win, tie = points == 1.0, points == 0.5
+    if not row['exists']:
+      self.connection.execute('INSERT INTO ratings VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)',
+                              (team, version, scope, row['rating'] + change, int(win), int(tie),
+                               int(not win and not tie), seconds, moves))
+    else:
+      self.connection.execute('UPDATE ratings SET rating = rating + ?, games = games + 1, wins = wins + ?, '
+                              'ties = ties + ?, losses = losses + ?, seconds = seconds + ?, moves = moves + ? '
+                              'WHERE team = ? AND version = ? AND layout = ?',
+                              (change, int(win), int(tie), int(not win and not tie), seconds, moves,
+                               team, version, scope))
+
+  def leaderboard(self):
+    "Overall ratings of every team version, best first"
+    return [dict(row) for row in self.connection.execute(
+      'SELECT * FROM ratings WHERE layout = ? ORDER BY rating DESC, team', (ALL_LAYOUTS,))]
+
+  def weaknesses(self, team, version = None):
+    """
+    A team's per-layout ratings, weakest first, each with 'delta' from its
+    overall rating.  Uses the team's most played version unless given one.
+    """
+    if version is None:
+      row = self.connection.execute('SELECT version FROM ratings WHERE team = ? AND layout = ? '
+                                    'ORDER BY games DESC LIMIT 1', (team, ALL_LAYOUTS)).fetchone()
+      if row is None: return []
+      version = row['version']
+    overall = self._rating(team, version, ALL_LAYOUTS)['rating']
+    rows = [dict(row) for row in self.connection.execute(
+      'SELECT * FROM ratings WHERE team = ? AND version = ? AND layout != ? ORDER BY rating, layout',
+      (team, version, ALL_LAYOUTS))]
+    for row in rows:
+      row['delta'] = row['rating'] - overall
+    return rows
+
+def ingestFile(store, path):
+  "Adds every game in a tournament results file; returns (new, seen, seedless) counts"
+  added = seen = seedless = 0
+  with open(path) as f:
+    for line in f:
+      try:
+        result = json.loads(line)
+      except ValueError:
+        continue
+      if result.get('seed') is None: seedless += 1
+      elif store.addResult(result): added += 1
+      else: seen += 1
+  return added, seen, seedless
+
+def formatRows(rows, layoutColumn = False):
+  title = layoutColumn and 'layout' or 'team'
+  lines = ['%4s %-24s %-12s %8s %6s %5s %5s %5s %9s%s' % ('rank', title, 'version', 'rating', 'games', 'win', 'tie',
+           'loss', 'ms/move', layoutColumn and '    delta' or '')]
+  for rank, row in enumerate(rows):
+    lines.append('%4d %-24s %-12s %8.1f %6d %5d %5d %5d %9.2f%s' % (
+      rank + 1, layoutColumn and row['layout'] or row['team'], row['version'] or '-', row['rating'], row['games'],
+      row['wins'], row['ties'], row['losses'], 1000 * row['seconds'] / max(1, row['moves']),
+      layoutColumn and ' %+8.1f' % row['delta'] or ''))
+  return '\n'.join(lines)
+
+if __name__ == '__main__':
+  import sys
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('--db', default=DEFAULT_DATABASE, help='The ratings database [Default: %default]')
+  options, args = parser.parse_args()
+  if not args or args[0] not in ['ingest', 'leaderboard', 'weaknesses']:
+    parser.error('choose one of: ingest, leaderboard, weaknesses')
+  store = RatingStore(options.db)
+  command, args = args[0], args[1:]
+  if command == 'ingest':
+    if not args: parser.error('give the results files to ingest')
+    for path in args:
+      print('%s: %d new games, %d already rated, %d without a seed skipped' % ((path,) + ingestFile(store, path)))
+  elif command == 'leaderboard':
+    print(formatRows(store.leaderboard()))
+  else:
+    if len(args) != 1: parser.error('give the team to analyse')
+    team = args[0][:-3] if args[0].endswith('.py') else args[0]
+    rows = store.weaknesses(team)
+    if not rows: print('No rated games for %s' % team)
+    else: print(formatRows(rows, layoutColumn = True))
+  store.close()
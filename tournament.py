@@ -0,0 +1,188 @@
+# tournament.py
+# -------------
+# Round-robin tournaments between capture teams.
+
+"""
+Plays every pairing of the given teams on every given layout, with each
+team taking both colors, across a pool of worker processes.  Finished games
+are appended to a results file as they come in, so a run that is stopped or
+crashes picks up where it left off when started again with the same file.
+
+USAGE:      python tournament.py -t <team>,<team>[,...] [options]
+EXAMPLES:   python tournament.py -t myTeam,baselineTeam -l defaultCapture,RANDOM13,RANDOM42
+            python tournament.py -t myTeam,baselineTeam,otherTeam -g 3 --workers 8 --results night.jsonl
+"""
+
+import json, os, zlib
+
+import capture
+import layout
+
+def scheduleGames(teams, layoutNames, gamesPerPairing):
+  """
+  Returns the (red, blue, layoutName, game) keys of a round robin: every
+  pair of teams on every layout, gamesPerPairing times with each team red.
+  """
+  schedule = []
+  for i, first in enumerate(teams):
+    for second in teams[i + 1:]:
+      for layoutName in layoutNames:
+        for game in range(gamesPerPairing):
+          schedule.append((first, second, layoutName, game))
+          schedule.append((second, first, layoutName, game))
+  return schedule
+
+def gameSeed(key, seed):
+  "A seed that depends only on the game, not on its place in the schedule"
+  return zlib.crc32(('%s|%s|%s|%d|%d' % (key + (seed,))).encode())
+
+def layoutText(layoutName):
+  if layoutName.startswith('RANDOM'):
+    return capture.randomLayout(int(layoutName[6:])).split('\n')
+  l = layout.getLayout(layoutName)
+  if l is None: raise Exception("The layout " + layoutName + " cannot be found")
+  return l.layoutText
+
+def resultKey(result):
+  return (result['red'], result['blue'], result['layout'], result['game'])
+
+def loadResults(path):
+  """
+  Reads the games already recorded in a results file, one JSON object per
+  line.  A line cut short by a crash is dropped and the file rewritten
+  without it, so new results are never appended onto a partial line.
+  """
+  if not os.path.exists(path): return []
+  results, damaged = [], False
+  with open(path) as f:
+    for line in f:
+      try:
+        results.append(json.loads(line))
+      except ValueError:
+        damaged = True
+  if damaged:
+    with open(path + '.tmp', 'w') as f:
+      for result in results:
+        f.write(json.dumps(result) + '\n')
+    os.replace(path + '.tmp', path)
+  return results
+
+def playTournament(teams, layoutNames, gamesPerPairing, resultsPath, workers = 1, length = 1200,
+                   seed = 0, catchExceptions = True, ratingsPath = None):
+  """
+  Plays the games of the round robin that the results file does not have
+  yet and returns the results of the whole schedule.  With ratingsPath,
+  new games are also added to that ratings.py database as they finish.
+  """
+  import multiprocessing, ratings
+  schedule = scheduleGames(teams, layoutNames, gamesPerPairing)
+  done = dict((resultKey(result), result) for result in loadResults(resultsPath))
+  pending = [key for key in schedule if key not in done]
+  print('%d games scheduled, %d already played' % (len(schedule), len(schedule) - len(pending)))
+
+  texts = dict((layoutName, layoutText(layoutName)) for layoutName in layoutNames)
+  fingerprints = dict((name, layout.internLayout(text).getWallFingerprint()) for name, text in texts.items())
+  hashes = dict((team, ratings.teamHash(team)) for team in teams)
+  store = ratingsPath and ratings.RatingStore(ratingsPath)
+  tasks = []
+  for index, key in enumerate(pending):
+    red, blue, layoutName, game = key
+    tasks.append({'index': index, 'seed': gameSeed(key, seed), 'layoutText': texts[layoutName],
+                  'teams': ((red, {}), (blue, {})), 'length': length, 'muteAgents': True,
+                  'catchExceptions': catchExceptions, 'record': False})
+
+  if tasks:
+    with open(resultsPath, 'a') as out, multiprocessing.Pool(max(1, min(workers, len(tasks)))) as pool:
+      for record in pool.imap_unordered(capture.playGameRecord, tasks):
+        red, blue, layoutName, game = pending[record['index']]
+        result = {'red': red, 'blue': blue, 'layout': layoutName, 'game': game, 'redHash': hashes[red],
+                  'blueHash': hashes[blue], 'fingerprint': fingerprints[layoutName]}
+        for field in ['seed', 'score', 'moves', 'crashed', 'timedOut', 'agentTimes', 'agentMoves']:
+          result[field] = record[field]
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+        os.fsync(out.fileno())
+        done[resultKey(result)] = result
+        if store: store.addResult(result)
+        print('%-20s vs %-20s on %-16s: %d' % (red, blue, layoutName, result['score']))
+
+  if store: store.close()
+  return [done[key] for key in schedule]
+
+def standings(teams, results):
+  """
+  Per-team totals, best first: games, wins, ties, losses, points (3 per
+  win, 1 per tie), score differential from the team's point of view,
+  forfeits (games lost to a crash or timeout) and each of its two agents'
+  average seconds per move.
+  """
+  table = dict((team, {'team': team, 'games': 0, 'wins': 0, 'ties': 0, 'losses': 0, 'points': 0,
+                       'differential': 0, 'forfeits': 0, 'times': [0.0, 0.0], 'moves': [0, 0]}) for team in teams)
+  for result in results:
+    for team, sign, indices in [(result['red'], 1, (0, 2)), (result['blue'], -1, (1, 3))]:
+      row = table[team]
+      score = sign * result['score']
+      row['games'] += 1
+      row['differential'] += score
+      if score > 0: row['wins'] += 1
+      elif score < 0: row['losses'] += 1
+      else: row['ties'] += 1
+      if result['crashed'] and score < 0: row['forfeits'] += 1
+      for agent, index in enumerate(indices):
+        row['times'][agent] += result['agentTimes'][index]
+        row['moves'][agent] += result['agentMoves'][index]
+  rows = list(table.values())
+  for row in rows:
+    row['points'] = 3 * row['wins'] + row['ties']
+    row['secondsPerMove'] = [t / max(1, m) for t, m in zip(row['times'], row['moves'])]
+  rows.sort(key = lambda row: (-row['points'], -row['differential'], row['team']))
+  return rows
+
+def formatStandings(rows):
+  lines = ['%4s %-24s %6s %5s %5s %5s %7s %8s %8s %12s %12s' % ('rank', 'team', 'games', 'win', 'tie', 'loss',
+           'points', 'diff', 'forfeits', 'ms/move 1st', 'ms/move 2nd')]
+  for rank, row in enumerate(rows):
+    lines.append('%4d %-24s %6d %5d %5d %5d %7d %+8d %8d %12.2f %12.2f' % (
+      rank + 1, row['team'], row['games'], row['wins'], row['ties'], row['losses'], row['points'],
+      row['differential'], row['forfeits'], 1000 * row['secondsPerMove'][0], 1000 * row['secondsPerMove'][1]))
+  return '\n'.join(lines) + '\n'
+
+def readCommand(argv):
+  from optparse import OptionParser
+  parser = OptionParser(__doc__)
+  parser.add_option('-t', '--teams', help='Comma separated team modules, e.g. myTeam,baselineTeam')
+  parser.add_option('-l', '--layouts', default='defaultCapture',
+                    help=capture.default('Comma separated layouts; RANDOM<seed> for generated mazes'))
+  parser.add_option('-g', '--games', type='int', default=1,
+                    help=capture.default('Games per pairing, layout and color'))
+  parser.add_option('-i', '--time', type='int', default=1200,
+                    help=capture.default('TIME limit of a game in moves'), metavar='TIME')
+  parser.add_option('--workers', type='int', default=os.cpu_count() or 1,
+                    help=capture.default('Worker processes'))
+  parser.add_option('--seed', type='int', default=0,
+                    help=capture.default('Base seed the per-game seeds are derived from'))
+  parser.add_option('--results', default='tournament.jsonl',
+                    help=capture.default('Results file, appended to and resumed from'))
+  parser.add_option('--standings', default='standings.txt',
+                    help=capture.default('Where to write the standings table'))
+  parser.add_option('--ratings', default=None, metavar='DB',
+                    help='Also add every new game to this ratings.py database')
+  parser.add_option('--unsafe', dest='catchExceptions', action='store_false', default=True,
+                    help='Let agent exceptions stop the run instead of forfeiting the game, and lift time limits')
+  options, args = parser.parse_args(argv)
+  if args: parser.error('Unrecognized options: ' + str(args))
+  teams = [team[:-3] if team.endswith('.py') else team for team in (options.teams or '').split(',') if team]
+  if len(teams) < 2 or len(set(teams)) != len(teams): parser.error('give at least two distinct teams with -t')
+  options.teams = teams
+  options.layouts = [l for l in options.layouts.split(',') if l]
+  return options
+
+if __name__ == '__main__':
+  import sys
+  options = readCommand(sys.argv[1:])
+  results = playTournament(options.teams, options.layouts, options.games, options.results, options.workers,
+                           options.time, options.seed, options.catchExceptions, options.ratings)
+  table = formatStandings(standings(options.teams, results))
+  with open(options.standings, 'w') as f:
+    f.write(table)
+  print(table)
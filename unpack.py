@@ -14,21 +14,22 @@
 
 import os, pickle, sys
 
+import replay
+
 if len(sys.argv) != 3:
   print('Usage: %s stats_file team_name' % sys.argv[0])
   print('Unpacks the stats file of a server into a bunch of replay files.')
   if len(sys.argv) == 2:
-    d = pickle.load(open(sys.argv[1]))
+    d = pickle.load(open(sys.argv[1], 'rb'))
     print('Team names:', list(d.keys()))
   sys.exit(2)
 
-d = pickle.load(open(sys.argv[1]))
+d = pickle.load(open(sys.argv[1], 'rb'))
 user = sys.argv[2]
 k = 0
 print('Unpacking games for', user)
 for g, w in d[user]['gameHistory']:
     k += 1
-    t = {'layout': g.state.data.layout, 'agents': g.agents, 'actions': g.moveHistory, 'length': g.length}
     fname = 'replay_' + user + '_' + str(k)
     print('Game:', fname)
-    pickle.dump(t,file(fname, 'w'))
+    replay.writeReplay(fname, g.state.data.layout.layoutText, g.moveHistory, g.length, 'Red', 'Blue', len(g.agents))